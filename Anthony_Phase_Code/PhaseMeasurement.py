@@ -1,14 +1,36 @@
 from qm.qua import *
-from qm import QuantumMachinesManager, generate_qua_script
+from qm import generate_qua_script
 from Phase_Measure.Amp_Only.amp_config import qop_ip, cluster_name, config
+from Phase_Measure.Drivers.qm_session import get_qm
+from Phase_Measure.Drivers.if_calibration import calibrate_beat
+from Phase_Measure.Drivers.stream_fetch import fetch_values
+from Phase_Measure.Drivers.stream_reduce import save_reduced, shots_per_value
+from Phase_Measure.Analysis.phase import PhaseExtractor
+from Phase_Measure.Analysis.fastplot import plot_decimated
+from Phase_Measure.Analysis.allan import shot_period_ns, shot_times_s, phase_to_time, drift_stats
 import numpy as np
 import matplotlib.pyplot as plt
 
 # DEMOD_FREQ_HZ = 10_181_818   # <---- change this later as needed
-DEMOD_FREQ_HZ = 10_000_000
+DEMOD_FREQ_HZ = 10_000_000    # expected beat; replaced by the measured value if CALIBRATE_IF
+CALIBRATE_IF = True           # measure the Aom1/Aom2 beat on lf_in1 first and demodulate at it
+IF_SEARCH_HZ = 1_000_000      # search DEMOD_FREQ_HZ +- this for the beat peak
 N_SHOTS = 100  # fixed acquisition count (no infinite loop)
+REDUCTION = "raw"  # "raw", "block_average", "decimate", "running_average" (see stream_reduce.py)
+BLOCK = 10  # shots per block for block_average / decimate (should divide N_SHOTS)
+PHASE_DTYPE = np.float64  # np.float32 halves the memory of the phase arrays
 Time=1000
 clockTime = Time * 250
+WAIT_STEP = 250  # wait(k) step between outer iterations, clock cycles (4 ns)
+N_ADEV_CURVES = 5  # wait settings shown in the Allan deviation plot
+
+# Reuses the QM session daemon (qm_session.py) if it is running
+qm = get_qm(config, qop_ip, cluster_name)
+
+if CALIBRATE_IF:
+    # Short raw-ADC capture of the beat note; its frequency becomes the demod IF below
+    DEMOD_FREQ_HZ = calibrate_beat(qm, config, "lf_in1_iq", f_expected=DEMOD_FREQ_HZ,
+                                   search_hz=IF_SEARCH_HZ)["if_hz"]
 
 with program() as iq_acquire_in1:
     n = declare(int)
@@ -23,7 +45,7 @@ with program() as iq_acquire_in1:
     # This assumes your element "lf_in1_iq" exists and has IF that can be updated.
     update_frequency("lf_in1_iq", DEMOD_FREQ_HZ)
 
-    with for_(k, 0, k < clockTime, k + 250):
+    with for_(k, 0, k < clockTime, k + WAIT_STEP):
         with for_(n, 0, n < N_SHOTS, n + 1):
             align("Aom1", "Aom2", "lf_in1_iq")
             play("cw", "Aom1")
@@ -38,14 +60,11 @@ with program() as iq_acquire_in1:
             save(Q, Q_st)
             wait(k)
 
-        with stream_processing():
-            I_st.save_all("I")
-            Q_st.save_all("Q")
-
+    with stream_processing():
+        save_reduced(I_st, "I", REDUCTION, BLOCK)
+        save_reduced(Q_st, "Q", REDUCTION, BLOCK)
 
 
-qmm = QuantumMachinesManager(host=qop_ip, cluster_name=cluster_name)
-qm = qmm.open_qm(config)
 
 job = qm.execute(iq_acquire_in1)
 res = job.result_handles
@@ -53,34 +72,63 @@ res.wait_for_all_values()
 
 # I_data = np.squeeze(res.get("I").fetch_all())
 # Q_data = np.squeeze(res.get("Q").fetch_all())
-I_raw = res.get("I").fetch_all()
-Q_raw = res.get("Q").fetch_all()
-
-I = [x[0] for x in I_raw]
-Q = [x[0] for x in Q_raw]
-print(I[:2])
-print(f"Fetched {len(I)} shots.")
+I = fetch_values(res, "I")
+Q = fetch_values(res, "Q")
+print(f"Fetched {len(I)} values ({REDUCTION}).")
 print("First 10 I:", I[:10])
 print("First 10 Q:", Q[:10])
 
 # phis = np.arctan2(I, Q)
-phis = np.arctan2(Q, I)
-
-plt.plot(phis, label="Arctan")
-plt.plot(I, label="I")
-plt.plot(Q, label="Q")
-plt.legend()
+# Wrapped and unwrapped phase in one pass (same result as np.unwrap(np.arctan2(Q, I)))
+phis, phis_unwrapped = PhaseExtractor(PHASE_DTYPE).process(I, Q)
+
+# Decimated to screen resolution (min/max per pixel); zooming re-decimates the visible range
+fig, ax = plt.subplots()
+plot_decimated(ax, phis, label="Arctan")
+plot_decimated(ax, I, label="I")
+plot_decimated(ax, Q, label="Q")
+ax.legend()
 plt.show()
 
 # Phase drift measurement Addition-Anthony
 # Question for hal about whether or not unwrapping fucks this.
-phis = np.arctan2(Q, I)
-phis_unwrapped = np.unwrap(phis)
 phase_drift = np.diff(phis_unwrapped)
 
-plt.figure()
-plt.plot(time_drift, phase_drift)
+# Sample times from the program: every shot takes the readout pulse plus wait(k), with k
+# stepped by the outer loop; each received value covers shots_per_value() shots
+waits = np.repeat(np.arange(0, clockTime, WAIT_STEP), N_SHOTS)
+shot_t = shot_times_s(shot_period_ns(config, "lf_in1_iq", waits))
+spv = shots_per_value(REDUCTION, BLOCK)
+t_values = shot_t[::spv][:len(phis_unwrapped)]
+time_drift = t_values[1:]
+
+fig, ax = plt.subplots()
+plot_decimated(ax, phase_drift, time_drift)
 plt.xlabel("Time")
 plt.ylabel("Phase drift (rad)")
 plt.title("Consecutive Phase Drift")
 plt.show()
+
+# Allan / modified Allan / time deviation of the phase, per wait setting (the sample
+# spacing is uniform within one setting). The phase is converted to time error at the
+# demodulation frequency.
+values_per_wait = N_SHOTS // spv
+x = phase_to_time(phis_unwrapped, DEMOD_FREQ_HZ)
+n_waits = len(x) // values_per_wait
+plt.figure()
+for w_idx in np.unique(np.linspace(0, n_waits - 1, min(N_ADEV_CURVES, n_waits)).astype(int)):
+    k_cycles = w_idx * WAIT_STEP
+    tau0 = shot_period_ns(config, "lf_in1_iq", k_cycles) * spv * 1e-9
+    seg = x[w_idx * values_per_wait:(w_idx + 1) * values_per_wait]
+    stats = drift_stats(seg, tau0)
+    if stats["tau_s"].size == 0:
+        continue
+    print(f"wait {4 * k_cycles} ns: ADEV(tau={stats['tau_s'][0]:.3g} s) = {stats['adev'][0]:.3g}, "
+          f"TDEV = {stats['tdev'][0]:.3g} s")
+    plt.loglog(stats["tau_s"], stats["adev"], "o-", label=f"ADEV, wait {4 * k_cycles} ns")
+    plt.loglog(stats["tau_s"], stats["mdev"], "x--", label=f"MDEV, wait {4 * k_cycles} ns")
+plt.xlabel("Tau (s)")
+plt.ylabel("Deviation")
+plt.title("Phase stability")
+plt.legend()
+plt.show()
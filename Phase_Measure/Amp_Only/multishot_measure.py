@@ -1,11 +1,47 @@
 from qm.qua import *
-from qm import QuantumMachinesManager, generate_qua_script
-from amp_config import qop_ip, cluster_name, config
+from qm import generate_qua_script
+from Phase_Measure.Amp_Only.amp_config import qop_ip, cluster_name, config
+from Phase_Measure.Drivers.qm_session import get_qm
+from Phase_Measure.Drivers.if_calibration import calibrate_beat
+from Phase_Measure.Drivers.stream_fetch import iter_chunks, fetch_values
+from Phase_Measure.Drivers.stream_reduce import save_reduced, reduced_length, shots_per_value
+from Phase_Measure.Analysis.phase import PhaseExtractor
+from Phase_Measure.Analysis.allan import shot_period_ns
+from Phase_Measure.Analysis.psd import WelchPSD
+from Phase_Measure.Analysis.fastplot import LivePlot, plot_decimated
+from Phase_Measure.Analysis.snippet_store import SnippetStore, open_snippets
 import numpy as np
 import matplotlib.pyplot as plt
+import os
+import tempfile
+import time
 #DEMOD_FREQ_HZ = 10_181_818   # <---- change this later as needed
-DEMOD_FREQ_HZ = 10_000_000
+DEMOD_FREQ_HZ = 10_000_000    # expected beat; replaced by the measured value if CALIBRATE_IF
+CALIBRATE_IF = True           # measure the Aom1/Aom2 beat on lf_in1 first and demodulate at it
+IF_SEARCH_HZ = 1_000_000      # search DEMOD_FREQ_HZ +- this for the beat peak
 N_SHOTS = 300_000            # fixed acquisition count (no infinite loop)
+STREAMING = True             # fetch I/Q in chunks while the job runs
+CHUNK_SHOTS = 10_000         # values per fetched chunk in streaming mode
+# Streaming mode writes I, Q, phase, unwrapped phase (one row per value) to a .npy record:
+# None = temporary file, deleted at the end; a folder = kept there as multishot_<time>.npy
+STREAM_DIR = None
+REDUCTION = "raw"            # "raw", "block_average", "decimate", "running_average" (see stream_reduce.py)
+BLOCK = 100                  # shots per block for block_average / decimate
+PHASE_DTYPE = np.float64     # np.float32 halves the memory of the phase arrays
+WAIT_CYCLES = 10000          # wait between shots, clock cycles (1 = 4 ns)
+PSD_NPERSEG = 4096           # samples per Welch segment (frequency resolution fs / PSD_NPERSEG)
+PSD_MIN_NPERSEG = 64         # skip the PSD if fewer values than ~3 segments of this size arrive
+LIVE_PLOT = False            # rolling phase / amplitude plot while streaming (fastplot.LivePlot)
+LIVE_WINDOW = 100_000        # values shown in the live plot
+LIVE_MAX_FPS = 10            # live plot frame-rate cap
+
+# Reuses the QM session daemon (qm_session.py) if it is running
+qm = get_qm(config, qop_ip, cluster_name)
+
+if CALIBRATE_IF:
+    # Short raw-ADC capture of the beat note; its frequency becomes the demod IF below
+    DEMOD_FREQ_HZ = calibrate_beat(qm, config, "lf_in1_iq", f_expected=DEMOD_FREQ_HZ,
+                                   search_hz=IF_SEARCH_HZ)["if_hz"]
 
 with program() as iq_acquire_in1:
     n = declare(int)
@@ -33,11 +69,11 @@ with program() as iq_acquire_in1:
         )
         save(I, I_st)
         save(Q, Q_st)
-        wait(10000) # 1 = 4ns
+        wait(WAIT_CYCLES) # 1 = 4ns
 
     with stream_processing():
-        I_st.save_all("I")
-        Q_st.save_all("Q")
+        save_reduced(I_st, "I", REDUCTION, BLOCK)
+        save_reduced(Q_st, "Q", REDUCTION, BLOCK)
 
 #sourceFile = open('debug.py', 'w')
 #print(generate_qua_script(iq_acquire_in1, config), file=sourceFile)
@@ -45,30 +81,101 @@ with program() as iq_acquire_in1:
 
 
 
-qmm = QuantumMachinesManager(host=qop_ip, cluster_name=cluster_name)
-qm = qmm.open_qm(config)
-
 job = qm.execute(iq_acquire_in1)
 res = job.result_handles
-res.wait_for_all_values()
+n_values = reduced_length(N_SHOTS, REDUCTION, BLOCK)  # values per stream after reduction
+
+# Sample rate of the received values: one shot = readout + wait, times the reduction block
+fs = 1e9 / (shot_period_ns(config, "lf_in1_iq", WAIT_CYCLES) * shots_per_value(REDUCTION, BLOCK))
+# Shorten the segments for short records so that at least 3 (half-overlapping) fit;
+# with too few values (e.g. running_average: 1) there is no meaningful spectrum
+psd_nperseg = min(PSD_NPERSEG, n_values // 2)
+if psd_nperseg >= PSD_MIN_NPERSEG:
+    phase_psd = WelchPSD(fs, nperseg=psd_nperseg)
+    amp_psd = WelchPSD(fs, nperseg=psd_nperseg)
+else:
+    phase_psd = amp_psd = None
+    print(f"Skipping the PSD: {n_values} values ({REDUCTION}) are too few for Welch segments "
+          f"of >= {PSD_MIN_NPERSEG} samples.")
+
+if STREAMING and REDUCTION != "running_average":
+    # Consume I/Q while the job runs; only one chunk is in flight at a time. The phase is
+    # unwrapped chunk by chunk (same result as np.unwrap on the whole record). Chunks go
+    # straight to a file, so the memory used does not grow with N_SHOTS
+    if STREAM_DIR is None:
+        fd, stream_path = tempfile.mkstemp(prefix="multishot_", suffix=".npy")
+        os.close(fd)
+    else:
+        os.makedirs(STREAM_DIR, exist_ok=True)
+        stream_path = os.path.join(STREAM_DIR, time.strftime("multishot_%Y%m%d_%H%M%S.npy"))
+    extractor = PhaseExtractor(PHASE_DTYPE)
+    live = LivePlot(("Unwrapped phase (rad)", "|I + iQ|"), LIVE_WINDOW, LIVE_MAX_FPS) if LIVE_PLOT else None
 
-#I_data = np.squeeze(res.get("I").fetch_all())
-#Q_data = np.squeeze(res.get("Q").fetch_all())
-I_raw = res.get("I").fetch_all()
-Q_raw = res.get("Q").fetch_all()
+    def acquire(store):
+        """Fetch, process and store every chunk; runs on a worker thread with LIVE_PLOT."""
+        n_done = 0
+        for I_chunk, Q_chunk in iter_chunks(res, ("I", "Q"), chunk_size=CHUNK_SHOTS, expected=n_values):
+            phi_chunk, unwrapped_chunk = extractor.process(I_chunk, Q_chunk)
+            amp_chunk = np.hypot(I_chunk, Q_chunk)
+            if phase_psd is not None:
+                phase_psd.update(unwrapped_chunk)
+                amp_psd.update(amp_chunk)
+            store.append(np.column_stack((I_chunk, Q_chunk, phi_chunk, unwrapped_chunk)))
+            if live is not None:
+                live.push(unwrapped_chunk, amp_chunk)  # no drawing here
+            n_done += len(I_chunk)
+            print(f"{n_done}/{n_values} values, mean phase of chunk {np.mean(phi_chunk):+.4f} rad")
+        return n_done
+
+    with SnippetStore(stream_path, width=4) as store:
+        # With the live plot, this (main / GUI) thread only draws while acquire() runs
+        n_done = live.run(acquire, store) if live is not None else acquire(store)
+    if live is not None:
+        live.close()
+    # Memory-mapped columns: the plots below read the record from disk
+    I, Q, phis, phis_unwrapped = open_snippets(stream_path).T
+    print(f"Fetched {n_done} values ({REDUCTION})" +
+          (f", saved to {stream_path}." if STREAM_DIR is not None else "."))
+else:
+    res.wait_for_all_values()
+
+    I = fetch_values(res, "I")
+    Q = fetch_values(res, "Q")
+    print(f"Fetched {len(I)} values ({REDUCTION}).")
+
+    #phis = np.arctan2(I, Q)
+    phis, phis_unwrapped = PhaseExtractor(PHASE_DTYPE).process(I, Q)
+    if phase_psd is not None:
+        phase_psd.update(phis_unwrapped)
+        amp_psd.update(np.hypot(I, Q))
 
-I = [x[0] for x in I_raw]
-Q = [x[0] for x in Q_raw]
-print(I[:2])
-print(f"Fetched {len(I)} shots.")
 print("First 10 I:", I[:10])
 print("First 10 Q:", Q[:10])
 
-#phis = np.arctan2(I, Q)
-phis = np.arctan2(Q, I)
+# Decimated to screen resolution (min/max per pixel); zooming re-decimates the visible range
+fig, ax = plt.subplots()
+plot_decimated(ax, phis, label="Arctan")
+plot_decimated(ax, phis_unwrapped, label="Unwrapped")
+plot_decimated(ax, I, label="I")
+plot_decimated(ax, Q, label="Q")
+ax.legend()
+plt.show()
+
+# Phase / amplitude noise spectra (Welch, single-sided)
+if phase_psd is not None:
+    f_psd, S_phi = phase_psd.result()
+    _, S_amp = amp_psd.result()
+    print(f"PSD: fs = {fs:.1f} Hz, {phase_psd.n_segments} segments of {phase_psd.nperseg} samples")
+    fig, (ax_phi, ax_amp) = plt.subplots(2, 1, sharex=True)
+    ax_phi.loglog(f_psd[1:], S_phi[1:])
+    ax_phi.set_ylabel("Phase PSD (rad$^2$/Hz)")
+    ax_amp.loglog(f_psd[1:], S_amp[1:])
+    ax_amp.set_ylabel("Amplitude PSD (demod units$^2$/Hz)")
+    ax_amp.set_xlabel("Frequency (Hz)")
+    plt.show()
 
-plt.plot(phis, label="Arctan")
-plt.plot(I, label="I")
-plt.plot(Q, label="Q")
-plt.legend()
-plt.show()
\ No newline at end of file
+if STREAMING and REDUCTION != "running_average" and STREAM_DIR is None:
+    # Release the memory-mapped record (figures included) before deleting it
+    plt.close("all")
+    del I, Q, phis, phis_unwrapped
+    os.remove(stream_path)
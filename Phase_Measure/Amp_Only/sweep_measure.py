@@ -0,0 +1,44 @@
+from Phase_Measure.Amp_Only.amp_config import qop_ip, cluster_name, config
+from Phase_Measure.Drivers.qm_session import get_qm
+from Phase_Measure.Drivers.if_calibration import calibrate_beat
+from Phase_Measure.Drivers.sweep import wait_axis, if_axis, amp_axis, run_sweep
+import numpy as np
+import matplotlib.pyplot as plt
+import time
+
+DEMOD_FREQ_HZ = 10_000_000    # expected beat; replaced by the measured value if CALIBRATE_IF
+CALIBRATE_IF = True           # measure the Aom1/Aom2 beat on lf_in1 first and sweep around it
+N_SHOTS = 1000                # shots per sweep point
+AVERAGE = False               # True: average the shots on the controller (shape without "shots")
+SAVE_PATH = time.strftime("sweep_%Y%m%d_%H%M%S.npz")
+
+# Reuses the QM session daemon (qm_session.py) if it is running
+qm = get_qm(config, qop_ip, cluster_name)
+
+if CALIBRATE_IF:
+    DEMOD_FREQ_HZ = calibrate_beat(qm, config, "lf_in1_iq", f_expected=DEMOD_FREQ_HZ)["if_hz"]
+
+# Outermost axis first; any subset / order of wait, IF and amplitude axes works
+AXES = [
+    wait_axis([4, 250, 2500, 25000]),                                # wait after each shot (4 ns cycles)
+    if_axis(DEMOD_FREQ_HZ + np.arange(-2, 3) * 10_000, "lf_in1_iq"),  # demod IF (Hz)
+    amp_axis([0.25, 0.5, 1.0], ("Aom1", "Aom2")),                    # reference amp() scale
+]
+
+result = run_sweep(qm, AXES, N_SHOTS, average=AVERAGE)
+print(f"{result} in {result.attrs['run_s']:.1f} s")
+result.save(SAVE_PATH)
+print(f"Saved to {SAVE_PATH}")
+
+# Mean demodulated amplitude over the shots vs the IF, one curve per amplitude, first wait
+mag = np.hypot(result["I"], result["Q"])
+if not AVERAGE:
+    mag = mag.mean(axis=-1)
+f_khz = (result.coords["if_hz"] - DEMOD_FREQ_HZ) / 1e3
+for j, a in enumerate(result.coords["amp"]):
+    plt.plot(f_khz, mag[0, :, j], "o-", label=f"amp {a:g}")
+plt.xlabel(f"IF - {DEMOD_FREQ_HZ:,} Hz (kHz)")
+plt.ylabel("mean |I + iQ| (demod units)")
+plt.title(f"wait = {result.coords['wait'][0]} cycles")
+plt.legend()
+plt.show()
@@ -0,0 +1,151 @@
+"""
+ddc.py
+
+Host-side digital down-conversion of raw ADC traces (e.g. `lf_in1` captured with
+`adc_stream=`), to cross-check the on-FPGA `demod.full` results or to use any IF /
+bandwidth without changing the program.
+
+- `DDC` mixes a trace (in volts, see stream_fetch.raw2volts) against exp(-i 2 pi IF t),
+  low-pass filters it with a windowed-sinc FIR and decimates. The trace can be fed in
+  chunks of any size: the last ntaps - 1 mixed samples, the mixer phase and the
+  decimation phase are carried over (overlap-save), so a multi-second trace is
+  processed in fixed memory and chunking does not change the output. method="direct"
+  only evaluates the filter at the kept output samples (polyphase cost, N * ntaps / D);
+  method="fft" filters each chunk by FFT convolution and is faster for long filters.
+- `demod_windows` integrates fixed windows of the trace exactly like
+  `demod.full("cos"/"sin")` with constant integration weights.
+
+Convention (same as the simulated backend, fake_qm.py): for an input
+V cos(2 pi IF t + phi),
+
+    I + iQ = 2**-12 * sum(x * exp(-i 2 pi IF t)) = 2**-12 * L V/2 * exp(i phi)
+
+so arctan2(Q, I) is the phase of the tone relative to the IF oscillator and
+`demod2volts(I, L, single_demod=True)` gives back V cos(phi). The complex baseband of
+`DDC` is V/2 exp(i phi) (unit DC gain); `baseband_to_demod(z, L)` converts it to the
+demod scale. Set sin_sign=-1 if the hardware's sin weights turn out to have the
+opposite sign.
+"""
+
+import numpy as np
+
+DEMOD_SCALE = 2.0 ** -12  # fixed-point scale of demod.full sums
+
+
+def lowpass_fir(ntaps, cutoff, beta=8.6):
+    """Kaiser-windowed sinc low-pass, cutoff as a fraction of the sample rate, unit DC gain."""
+    n = np.arange(ntaps) - (ntaps - 1) / 2
+    h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(ntaps, beta)
+    return h / h.sum()
+
+
+def baseband_to_demod(z, window_len, sin_sign=1):
+    """Complex baseband (V/2 e^{i phi}) -> demod.full (I, Q) over window_len samples."""
+    s = np.asarray(z) * window_len * DEMOD_SCALE
+    return s.real, sin_sign * s.imag
+
+
+def demod_windows(trace_v, fs, if_hz, window_len, n0=0, phase0=0.0, sin_sign=1):
+    """
+    demod.full-style (I, Q) of consecutive windows of window_len samples.
+
+    n0 is the sample index of trace_v[0] on the IF oscillator's time axis (for chunked
+    traces); an incomplete trailing window is ignored.
+    """
+    x = np.asarray(trace_v, dtype=np.float64)
+    n_win = x.size // window_len
+    w = 2 * np.pi * if_hz / fs
+    lo = np.exp(-1j * w * np.arange(window_len))
+    sums = x[:n_win * window_len].reshape(n_win, window_len) @ lo
+    start = n0 + np.arange(n_win) * window_len
+    sums *= np.exp(-1j * (np.mod(w * start, 2 * np.pi) + phase0))
+    return sums.real * DEMOD_SCALE, sin_sign * sums.imag * DEMOD_SCALE
+
+
+class DDC:
+    """Streaming mix -> FIR low-pass -> decimate, with overlap-save state between chunks."""
+
+    def __init__(self, fs, if_hz, decim, cutoff_hz=None, ntaps=None, phase0=0.0, method="direct",
+                 beta=8.6):
+        if method not in ("direct", "fft"):
+            raise ValueError(f"unknown method {method!r}")
+        self.fs = float(fs)
+        self.if_hz = float(if_hz)
+        self.decim = int(decim)
+        self.fs_out = self.fs / self.decim
+        if cutoff_hz is None:
+            cutoff_hz = 0.4 * self.fs_out
+        if ntaps is None:
+            ntaps = 8 * self.decim + 1
+        self.h = lowpass_fir(int(ntaps), cutoff_hz / self.fs, beta)  # beta: Kaiser stop-band depth
+        self.ntaps = self.h.size
+        self.delay = (self.ntaps - 1) / 2  # group delay, input samples
+        self.method = method
+        self.phase0 = phase0
+        self.reset()
+
+    def reset(self):
+        self._hist = np.zeros(self.ntaps - 1, dtype=np.complex128)
+        self.n_in = 0    # input samples consumed
+        self.n_out = 0   # output samples produced
+
+    def _mix(self, x):
+        w = 2 * np.pi * self.if_hz / self.fs
+        start = np.mod(w * self.n_in + self.phase0, 2 * np.pi)
+        return x * np.exp(-1j * (start + w * np.arange(x.size)))
+
+    def process(self, x):
+        """
+        Complex baseband of one chunk of the trace (volts). Output sample m is the
+        filtered signal at input sample m * decim (delayed by self.delay samples).
+        """
+        x = np.asarray(x, dtype=np.float64).reshape(-1)
+        buf = np.concatenate((self._hist, self._mix(x)))
+        # First output in this chunk: the next multiple of decim at or after n_in
+        j0 = (-self.n_in) % self.decim
+        if self.method == "direct":
+            frames = np.lib.stride_tricks.sliding_window_view(buf, self.ntaps)[j0::self.decim]
+            y = frames @ self.h[::-1]
+        else:
+            n_fft = 1 << int(np.ceil(np.log2(buf.size + self.ntaps - 1)))
+            full = np.fft.ifft(np.fft.fft(buf, n_fft) * np.fft.fft(self.h, n_fft))
+            y = full[self.ntaps - 1:buf.size][j0::self.decim]
+        self._hist = buf[buf.size - (self.ntaps - 1):].copy()
+        self.n_in += x.size
+        self.n_out += y.size
+        return y
+
+    def process_all(self, trace_v, chunk_size=1 << 20):
+        """Whole trace (array or memmap), processed in chunks of chunk_size samples."""
+        out = [self.process(trace_v[i:i + chunk_size]) for i in range(0, len(trace_v), chunk_size)]
+        return np.concatenate(out) if out else np.empty(0, np.complex128)
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    fs, f_if, V, phi = 1e9, 10e6, 0.2, 0.7
+    n = 2_000_000
+    t = np.arange(n) / fs
+    # Tone 2 kHz above the IF: the baseband phase advances 2 pi 2 kHz t
+    x = V * np.cos(2 * np.pi * (f_if + 2e3) * t + phi) + rng.normal(0, 2e-3, n)
+
+    ddc = DDC(fs, f_if, decim=100, cutoff_hz=1e6, ntaps=801)
+    z_whole = ddc.process_all(x, chunk_size=n)
+    for method, chunk in (("direct", 12_345), ("fft", 100_003)):
+        z = DDC(fs, f_if, 100, 1e6, 801, method=method).process_all(x, chunk_size=chunk)
+        assert np.allclose(z, z_whole, atol=1e-12), method
+    settled = z_whole[20:]
+    t_out = (np.arange(z_whole.size)[20:] * 100 - ddc.delay) / fs
+    expect = V / 2 * np.exp(1j * (2 * np.pi * 2e3 * t_out + phi))
+    assert np.max(np.abs(settled - expect)) < 2e-3, np.max(np.abs(settled - expect))
+
+    # Per-window I/Q vs the baseband, and the demod2volts round trip
+    L = 10_000
+    I, Q = demod_windows(x, fs, f_if, L)
+    I_b, Q_b = baseband_to_demod(z_whole[L // 100 // 2::L // 100][:I.size], L)
+    assert np.allclose(I, I_b, atol=0.02 * np.max(np.abs(I))) and np.allclose(Q, Q_b, atol=0.02 * np.max(np.abs(I)))
+    I1, Q1 = demod_windows(x[:L], fs, f_if, L)
+    assert np.isclose(np.hypot(I1, Q1)[0] * 2 * 4096 / L, V, rtol=0.01)
+    I2, Q2 = demod_windows(x[L:3 * L], fs, f_if, L, n0=L)
+    assert np.allclose(np.r_[I1, I2], I[:3]) and np.allclose(np.r_[Q1, Q2], Q[:3])
+    print(f"OK: {n} samples -> {z_whole.size} baseband samples at {ddc.fs_out / 1e6:.0f} MS/s")
@@ -0,0 +1,328 @@
+"""
+fastplot.py
+
+Plotting of long records (300k+ shots) at screen resolution.
+
+A line plot cannot show more than a couple of points per horizontal pixel, so the
+records are decimated before they reach matplotlib:
+
+- `minmax_decimate`: per pixel bin, the min and the max in their original order. Every
+  spike and the full envelope stay visible; vectorized, O(N).
+- `lttb`: Largest-Triangle-Three-Buckets, one point per bin chosen to keep the visual
+  shape (smoother for slowly varying traces). O(N) with a Python loop over bins.
+
+`plot_decimated(ax, y)` draws a `DecimatedLine`, which keeps the full record and
+re-decimates the visible range when the x limits change, so zooming in on a static plot
+brings back full detail.
+
+`LivePlot` shows the latest `capacity` samples of one or more series while the
+acquisition runs. The acquisition only calls `push()`, which copies the new samples into
+a ring buffer under a lock. Drawing happens on the GUI (main) thread: `run(acquire)`
+starts the acquisition on a worker thread and redraws at most max_fps times per second
+until it returns, keeping the GUI event loop running in between. A frame decimates the
+ring to the axes width and redraws just the lines with blitting, so its cost does not
+grow with the record length, and the acquisition never waits on a figure render:
+
+    live = LivePlot(("phase (rad)", "|IQ|"), capacity=100_000, max_fps=10)
+
+    def acquire():                  # worker thread: fetch, process, push
+        for I, Q in iter_chunks(res, ("I", "Q")):
+            _, phi = extractor.process(I, Q)
+            live.push(phi, np.hypot(I, Q))
+
+    live.run(acquire)               # this thread draws until acquire() returns
+    live.close()
+"""
+
+import threading
+import time
+
+import numpy as np
+
+
+# -----------------------------
+# Decimation
+# -----------------------------
+def minmax_decimate(y, n_bins, x=None):
+    """
+    (x, y) reduced to the min and max of each of n_bins equal bins (<= 2 n_bins points,
+    in time order). Records that already fit are returned unchanged.
+    """
+    y = np.asarray(y)
+    n = y.size
+    x = np.arange(n) if x is None else np.asarray(x)
+    if n <= 2 * n_bins:
+        return x, y
+    size = int(np.ceil(n / n_bins))
+    n_full = n // size
+    blocks = y[:n_full * size].reshape(n_full, size)
+    base = np.arange(n_full) * size
+    i_min = base + np.argmin(blocks, axis=1)
+    i_max = base + np.argmax(blocks, axis=1)
+    if n_full * size < n:  # partial last bin
+        tail = y[n_full * size:]
+        i_min = np.append(i_min, n_full * size + np.argmin(tail))
+        i_max = np.append(i_max, n_full * size + np.argmax(tail))
+    idx = np.sort(np.stack((i_min, i_max), axis=1), axis=1).reshape(-1)
+    return x[idx], y[idx]
+
+
+def lttb(y, n_out, x=None):
+    """Largest-Triangle-Three-Buckets downsampling of (x, y) to n_out points."""
+    y = np.asarray(y, dtype=float)
+    n = y.size
+    x = np.arange(n, dtype=float) if x is None else np.asarray(x, dtype=float)
+    if n_out >= n or n_out < 3:
+        return x, y
+    # Bucket edges for the n - 2 inner points; first and last points are always kept
+    edges = (np.arange(n_out - 1) * (n - 2) / (n_out - 2)).astype(np.int64) + 1
+    edges[-1] = n - 1
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point)
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return x[out], y[out]
+
+
+DECIMATORS = {"minmax": lambda x, y, n: minmax_decimate(y, n, x),
+              "lttb": lambda x, y, n: lttb(y, 2 * n, x)}
+
+
+def _axes_pixels(ax):
+    return max(int(ax.bbox.width), 100)
+
+
+# -----------------------------
+# Static plots
+# -----------------------------
+class DecimatedLine:
+    """A Line2D showing a decimated view of (x, y), refreshed when the x limits change."""
+
+    def __init__(self, ax, y, x=None, method="minmax", n_px=None, **plot_kw):
+        if method not in DECIMATORS:
+            raise ValueError(f"unknown method {method!r}, expected one of {tuple(DECIMATORS)}")
+        self.ax = ax
+        self.y = np.asarray(y)
+        self.x = np.arange(self.y.size) if x is None else np.asarray(x)
+        self.method = method
+        self.n_px = n_px
+        self.line, = ax.plot(*self._view(None), **plot_kw)
+        # The callback registry only holds a weak reference: keep this object alive with its line
+        self.line._decimated = self
+        ax.callbacks.connect("xlim_changed", self._on_xlim)
+
+    def _view(self, xlim):
+        x, y = self.x, self.y
+        if xlim is not None and x.size:
+            # x is sorted (sample index / time): slice the visible range plus one point
+            lo = max(int(np.searchsorted(x, min(xlim), "left")) - 1, 0)
+            hi = int(np.searchsorted(x, max(xlim), "right")) + 1
+            x, y = x[lo:hi], y[lo:hi]
+        return DECIMATORS[self.method](x, y, self.n_px or _axes_pixels(self.ax))
+
+    def _on_xlim(self, ax):
+        self.line.set_data(*self._view(ax.get_xlim()))
+
+
+def plot_decimated(ax, y, x=None, method="minmax", n_px=None, **plot_kw):
+    """ax.plot(x, y) for long records: draws at most ~2 points per pixel. Returns the Line2D."""
+    return DecimatedLine(ax, y, x, method, n_px, **plot_kw).line
+
+
+# -----------------------------
+# Live plots
+# -----------------------------
+class LivePlot:
+    """Rolling plot of the latest `capacity` samples of each series, blitted at <= max_fps."""
+
+    def __init__(self, labels, capacity=100_000, max_fps=10.0, method="minmax", title=None):
+        import matplotlib.pyplot as plt
+
+        self.labels = tuple(labels)
+        self.capacity = int(capacity)
+        self.min_interval = 1.0 / max_fps
+        self.method = method
+        self._buf = np.full((len(self.labels), self.capacity), np.nan)
+        self._n = 0                 # samples pushed per series
+        self._lock = threading.Lock()
+        self._last_draw = 0.0
+        self.n_frames = 0
+        self.draw_s = 0.0           # total time spent drawing
+
+        self.fig, axes = plt.subplots(len(self.labels), 1, sharex=True, squeeze=False)
+        self.axes = axes[:, 0]
+        self.lines = []
+        for ax, label in zip(self.axes, self.labels):
+            ax.set_ylabel(label)
+            line, = ax.plot([], [], lw=0.8, animated=True)
+            self.lines.append(line)
+        # x = samples before the newest one: the limits stay fixed while the data rolls
+        self.axes[-1].set_xlim(-self.capacity, 0)
+        self.axes[-1].set_xlabel("samples before latest")
+        if title:
+            self.fig.suptitle(title)
+        self.canvas = self.fig.canvas
+        self._blit = getattr(self.canvas, "supports_blit", False)
+        self._background = None
+        plt.show(block=False)
+        self._full_draw()
+
+    # --- data side (any thread)
+    def push(self, *series):
+        """Append one chunk per series (all the same length)."""
+        chunks = [np.asarray(s, dtype=float).reshape(-1) for s in series]
+        k = chunks[0].size
+        if len(chunks) != len(self.labels) or any(c.size != k for c in chunks):
+            raise ValueError(f"expected {len(self.labels)} series of equal length")
+        with self._lock:
+            if k >= self.capacity:
+                chunks = [c[-self.capacity:] for c in chunks]
+                start, k_kept = (self._n + k - self.capacity) % self.capacity, self.capacity
+            else:
+                start, k_kept = self._n % self.capacity, k
+            first = min(k_kept, self.capacity - start)
+            for row, c in zip(self._buf, chunks):
+                row[start:start + first] = c[:first]
+                row[:k_kept - first] = c[first:]
+            self._n += k
+
+    def snapshot(self):
+        """(x, ys): the buffered samples in time order."""
+        with self._lock:
+            n, w = self._n, self._n % self.capacity
+            if n <= self.capacity:
+                ys = self._buf[:, :n].copy()
+            else:
+                ys = np.concatenate((self._buf[:, w:], self._buf[:, :w]), axis=1)
+        return np.arange(n - ys.shape[1], n), ys
+
+    # --- drawing side (GUI / main thread)
+    def run(self, target, *args):
+        """
+        Call target(*args) on a worker thread and redraw on this thread until it returns.
+        `target` should only push() into the plot. Returns its result; an exception raised
+        in the worker is re-raised here.
+        """
+        outcome = {}
+
+        def worker():
+            try:
+                outcome["result"] = target(*args)
+            except BaseException as e:
+                outcome["error"] = e
+
+        thread = threading.Thread(target=worker, name="LivePlot acquisition", daemon=True)
+        thread.start()
+        while thread.is_alive():
+            self.redraw()
+            # Process GUI events (zoom, resize, close) until the next frame is due
+            self.canvas.start_event_loop(self.min_interval)
+        thread.join()
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome.get("result")
+
+    def redraw(self, force=False):
+        """Draw the buffered samples if 1 / max_fps has passed since the last frame."""
+        now = time.perf_counter()
+        if not force and now - self._last_draw < self.min_interval:
+            return False
+        x, ys = self.snapshot()
+        if x.size == 0:
+            return False
+        x = x - x[-1]
+        rescale = False
+        for ax, line, y in zip(self.axes, self.lines, ys):
+            xd, yd = DECIMATORS[self.method](x, y, _axes_pixels(ax))
+            line.set_data(xd, yd)
+            rescale |= self._ylimits(ax, yd)
+        if rescale or not self._blit or self._background is None:
+            self._full_draw()
+        else:
+            self.canvas.restore_region(self._background)
+            for ax, line in zip(self.axes, self.lines):
+                ax.draw_artist(line)
+            self.canvas.blit(self.fig.bbox)
+        self.canvas.flush_events()
+        self.n_frames += 1
+        self._last_draw = time.perf_counter()
+        self.draw_s += self._last_draw - now
+        return True
+
+    def _ylimits(self, ax, y):
+        """Widen the y limits if the data left them (needs a full redraw)."""
+        y = y[np.isfinite(y)]
+        lo, hi = ax.get_ylim()
+        if not y.size or (y.min() >= lo and y.max() <= hi):
+            return False
+        pad = 0.1 * (y.max() - y.min() or 1.0)
+        ax.set_ylim(y.min() - pad, y.max() + pad)
+        return True
+
+    def _full_draw(self):
+        self.canvas.draw()
+        if self._blit:
+            self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+            for ax, line in zip(self.axes, self.lines):
+                ax.draw_artist(line)
+            self.canvas.blit(self.fig.bbox)
+
+    def close(self, final_redraw=True):
+        """Draw the last samples and print the frame statistics."""
+        if final_redraw:
+            self.redraw(force=True)
+        if self.n_frames:
+            print(f"Live plot: {self.n_frames} frames, {1e3 * self.draw_s / self.n_frames:.1f} ms/frame, "
+                  f"{self._n} samples pushed")
+
+
+if __name__ == "__main__":
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    rng = np.random.default_rng(0)
+    n = 1_000_003
+    y = np.cumsum(rng.normal(0, 1, n))
+    y[123_456] += 500  # a spike must survive min/max decimation
+    xd, yd = minmax_decimate(y, 1000)
+    assert xd.size <= 2000 and np.all(np.diff(xd) >= 0)
+    assert yd.max() == y.max() and yd.min() == y.min()
+    xl, yl = lttb(y, 2000)
+    assert xl.size == 2000 and xl[0] == 0 and xl[-1] == n - 1 and np.all(np.diff(xl) > 0)
+
+    fig, ax = plt.subplots()
+    line = plot_decimated(ax, y)
+    assert len(line.get_xdata()) <= 2 * _axes_pixels(ax)
+    ax.set_xlim(1000, 1100)   # zoom: full detail again
+    assert len(line.get_xdata()) == 103
+
+    live = LivePlot(("a", "b"), capacity=50_000, max_fps=50)
+    push_s = []
+
+    def acquire():
+        for i in range(0, 203_000, 7_000):
+            t0 = time.perf_counter()
+            live.push(y[i:i + 7_000], -y[i:i + 7_000])
+            push_s.append(time.perf_counter() - t0)
+            time.sleep(0.01)  # chunk arrival
+        return len(push_s)
+
+    t = time.perf_counter()
+    assert live.run(acquire) == 29
+    x_live, ys = live.snapshot()
+    k = 203_000 - 50_000
+    assert np.array_equal(ys[0], y[k:203_000]) and x_live[0] == k
+    frame_ms = 1e3 * live.draw_s / max(live.n_frames, 1)
+    live.close()
+    assert live.n_frames > 1
+    print(f"OK: {time.perf_counter() - t:.2f} s, {live.n_frames} live frames of {frame_ms:.1f} ms "
+          f"drawn on the main thread; push() took at most {1e3 * max(push_s):.2f} ms")
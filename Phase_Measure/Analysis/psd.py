@@ -0,0 +1,139 @@
+"""
+psd.py
+
+Memory-bounded Welch power spectral density of long phase / amplitude records.
+
+`WelchPSD` takes samples in chunks of any size. The chunks can come from memory, from
+an `np.memmap`, or live from `iter_chunks` while the job runs. It cuts the stream into
+segments of `nperseg` samples with `noverlap` overlap, then detrends, windows and FFTs
+each one and adds its periodogram to a running sum. The only state kept between chunks
+is that sum plus less than one segment of leftover samples.
+
+The output is the single-sided density in <input unit>^2/Hz. For unwrapped phase in rad
+that is rad^2/Hz, and the normalization matches `scipy.signal.welch(...,
+scaling="density")`:
+
+    fs = 1 / (shot_period_ns(config, "lf_in1_iq") * 1e-9)     # allan.py
+    psd = WelchPSD(fs, nperseg=2**16)
+    for I, Q in iter_chunks(res, ("I", "Q")):
+        _, phi = extractor.process(I, Q)
+        psd.update(phi)
+    f, S_phi = psd.result()
+"""
+
+import numpy as np
+
+WINDOWS = ("hann", "hamming", "blackman", "boxcar")
+
+
+def get_window(name, n):
+    """Periodic (DFT-even) window of length n, as used for spectral estimation."""
+    if not isinstance(name, str):
+        w = np.asarray(name, dtype=float)
+        if w.size != n:
+            raise ValueError(f"window has {w.size} samples, expected {n}")
+        return w
+    k = 2 * np.pi * np.arange(n) / n
+    if name == "hann":
+        return 0.5 - 0.5 * np.cos(k)
+    if name == "hamming":
+        return 0.54 - 0.46 * np.cos(k)
+    if name == "blackman":
+        return 0.42 - 0.5 * np.cos(k) + 0.08 * np.cos(2 * k)
+    if name == "boxcar":
+        return np.ones(n)
+    raise ValueError(f"unknown window {name!r}, expected one of {WINDOWS} or an array")
+
+
+class WelchPSD:
+    """Streaming averaged periodogram (Welch) with overlap and windowing."""
+
+    def __init__(self, fs, nperseg=4096, noverlap=None, window="hann", detrend="constant",
+                 batch=256):
+        if detrend not in (None, "constant", "linear"):
+            raise ValueError(f"unknown detrend {detrend!r}")
+        self.fs = float(fs)
+        self.nperseg = int(nperseg)
+        self.noverlap = self.nperseg // 2 if noverlap is None else int(noverlap)
+        if not 0 <= self.noverlap < self.nperseg:
+            raise ValueError("noverlap must be in [0, nperseg)")
+        self.hop = self.nperseg - self.noverlap
+        self.window = get_window(window, self.nperseg)
+        self.detrend = detrend
+        self.batch = batch  # segments transformed at once (bounds the FFT temporaries)
+        self.reset()
+
+    def reset(self):
+        self._sum = np.zeros(self.nperseg // 2 + 1)
+        self._tail = np.empty(0)
+        self.n_segments = 0
+        self.n_samples = 0
+
+    def update(self, x):
+        """Add a chunk of samples."""
+        x = np.asarray(x, dtype=np.float64).reshape(-1)
+        self.n_samples += x.size
+        buf = np.concatenate((self._tail, x)) if self._tail.size else x
+        n_seg = (buf.size - self.nperseg) // self.hop + 1 if buf.size >= self.nperseg else 0
+        if n_seg:
+            frames = np.lib.stride_tricks.sliding_window_view(buf, self.nperseg)[::self.hop][:n_seg]
+            for i in range(0, n_seg, self.batch):
+                self._sum += self._periodograms(frames[i:i + self.batch])
+            self.n_segments += n_seg
+        # Keep the samples from the next segment start on
+        self._tail = buf[n_seg * self.hop:].copy()
+
+    def _periodograms(self, frames):
+        if self.detrend == "constant":
+            frames = frames - frames.mean(axis=1, keepdims=True)
+        elif self.detrend == "linear":
+            t = np.arange(self.nperseg) - (self.nperseg - 1) / 2
+            slope = frames @ t / (t @ t)
+            frames = frames - frames.mean(axis=1, keepdims=True) - slope[:, None] * t
+        spec = np.fft.rfft(frames * self.window, axis=1)
+        return (spec.real ** 2 + spec.imag ** 2).sum(axis=0)
+
+    def result(self):
+        """(f_hz, psd): single-sided density averaged over all complete segments."""
+        f = np.fft.rfftfreq(self.nperseg, 1 / self.fs)
+        if self.n_segments == 0:
+            return f, np.full(f.size, np.nan)
+        psd = self._sum / (self.n_segments * self.fs * np.sum(self.window ** 2))
+        # One-sided: double everything except DC and (for even nperseg) Nyquist
+        psd[1:-1 if self.nperseg % 2 == 0 else None] *= 2
+        return f, psd
+
+
+def welch(x, fs, nperseg=4096, noverlap=None, window="hann", detrend="constant",
+          chunk_size=1 << 22):
+    """Welch PSD of an array or np.memmap, read `chunk_size` samples at a time."""
+    est = WelchPSD(fs, nperseg, noverlap, window, detrend)
+    for i in range(0, len(x), chunk_size):
+        est.update(x[i:i + chunk_size])
+    return est.result()
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    fs = 20e3
+    n = 1_000_000
+    t = np.arange(n) / fs
+    x = 0.01 * np.sin(2 * np.pi * 1234.0 * t) + np.cumsum(rng.normal(0, 1e-3, n))
+
+    f, p = welch(x, fs, nperseg=4096, chunk_size=10_007)
+    f2, p2 = welch(x, fs, nperseg=4096, chunk_size=n)
+    assert np.allclose(p, p2, rtol=1e-10)
+    try:
+        from scipy.signal import welch as sp_welch
+    except ImportError:
+        sp_welch = None
+    if sp_welch is not None:
+        for window, detrend, nov in (("hann", "constant", None), ("blackman", "linear", 1000),
+                                     ("boxcar", False, 0)):
+            _, ref = sp_welch(x, fs, window=window, nperseg=4096, noverlap=nov, detrend=detrend)
+            _, mine = welch(x, fs, 4096, nov, window, detrend or None, chunk_size=77_777)
+            assert np.allclose(mine, ref, rtol=1e-9), (window, detrend)
+    # White noise of variance s^2: one-sided level 2 s^2 / fs
+    _, pw = welch(rng.normal(0, 0.5, n), fs, 1024)
+    assert abs(np.median(pw[1:-1]) / (2 * 0.25 / fs) - 1) < 0.05
+    print(f"OK: peak at {f[np.argmax(p * (f > 100))]:.1f} Hz")
@@ -0,0 +1,278 @@
+"""
+pulse_features.py
+
+Pulse-shape features of captured snippets (dark counts / SNSPD pulses cut out by
+continuous_capture.py), computed for all snippets at once.
+
+Per snippet (row), with the trigger at column `pre` and the pulse polarity as in
+pulse_detect ("Below" = negative pulses):
+
+    baseline    mean of the pre-trigger samples (V); noise = their std
+    amplitude   peak height above the baseline along the polarity (V, > 0)
+    peak_time   time of the peak from the trigger, parabolic sub-sample (ns)
+    rise, fall  10-90 % / 90-10 % times of the leading / trailing edge, linear
+                interpolation between samples (ns; NaN if the level is never crossed)
+    area        integral of the baseline-subtracted pulse along the polarity (V ns)
+    score       correlation coefficient with the mean pulse template (-1..1)
+
+The template is the mean of the amplitude-normalized pulses with amplitude >=
+min_snr * noise (first pass), unless one is given. Everything is processed in chunks of
+`chunk_rows` rows, so inputs can be memory-mapped files of millions of snippets:
+SnippetStore `.npy` files and the older `np.savez` `counts_no_signal_*.npz` files (the
+uncompressed member is mapped straight out of the zip). The result is a compact
+float32 structured table (~32 bytes per snippet) for filtering:
+
+    feats = extract_features("counts_no_signal_2.npy")
+    good = feats[(feats["score"] > 0.9) & (feats["amplitude"] > 0.1)]
+    save_features("counts_no_signal_2_features.npy", feats)
+"""
+
+import os
+import zipfile
+
+import numpy as np
+
+from Phase_Measure.Analysis.pulse_detect import PRE_SAMPLES
+
+FEATURE_DTYPE = np.dtype([
+    ("baseline", np.float32), ("noise", np.float32), ("amplitude", np.float32),
+    ("peak_time", np.float32), ("rise", np.float32), ("fall", np.float32),
+    ("area", np.float32), ("score", np.float32),
+])
+DEFAULT_CHUNK_ROWS = 4096
+
+
+# -----------------------------
+# Input
+# -----------------------------
+def _npz_member_memmap(path, name=None):
+    """Memory-map an uncompressed array stored in an .npz (np.savez), or None if compressed."""
+    with zipfile.ZipFile(path) as zf:
+        infos = [i for i in zf.infolist() if i.filename.endswith(".npy")]
+        info = infos[0] if name is None else zf.getinfo(name + ".npy")
+        if info.compress_type != zipfile.ZIP_STORED:
+            return None
+    with open(path, "rb") as f:
+        f.seek(info.header_offset)
+        local = f.read(30)
+        # Local file header: name length at 26, extra length at 28
+        n_name = int.from_bytes(local[26:28], "little")
+        n_extra = int.from_bytes(local[28:30], "little")
+        start = info.header_offset + 30 + n_name + n_extra
+        f.seek(start)
+        version = np.lib.format.read_magic(f)
+        if version[0] == 1:
+            read_header = np.lib.format.read_array_header_1_0
+        elif version[0] == 2:
+            read_header = np.lib.format.read_array_header_2_0
+        else:
+            raise ValueError(f"{path}: {info.filename} has unsupported .npy format version "
+                             f"{version[0]}.{version[1]} (memory-mapping supports 1.x and 2.x)")
+        shape, fortran, dtype = read_header(f)
+        offset = f.tell()
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape,
+                     order="F" if fortran else "C")
+
+
+def open_snippet_file(path, name=None):
+    """
+    (n_snippets, width) array of a snippet file without loading it: `.npy` (SnippetStore)
+    is memory-mapped, `.npz` members too when uncompressed (name=None: first array).
+    """
+    path = os.fspath(path)
+    if path.endswith(".npz"):
+        data = _npz_member_memmap(path, name)
+        if data is None:  # savez_compressed: has to be read
+            with np.load(path) as z:
+                data = z[name or z.files[0]]
+    else:
+        data = np.load(path, mmap_mode="r")
+    if data.ndim != 2:
+        raise ValueError(f"{path}: expected (n_snippets, width) snippets, got shape {data.shape}")
+    return data
+
+
+def _as_array(source, name=None):
+    return open_snippet_file(source, name) if isinstance(source, (str, os.PathLike)) else source
+
+
+# -----------------------------
+# Features
+# -----------------------------
+def _signed(rows, pre, polarity):
+    """Baseline, noise and the baseline-subtracted pulse made positive-going."""
+    if polarity not in ("Below", "Above"):
+        raise ValueError(f"polarity must be 'Below' or 'Above', got {polarity!r}")
+    x = np.asarray(rows, dtype=np.float64)
+    base = x[:, :pre].mean(axis=1)
+    noise = x[:, :pre].std(axis=1)
+    s = x - base[:, None]
+    if polarity == "Below":
+        np.negative(s, out=s)
+    return base, noise, s
+
+
+def _last_below_before(s, level, stop):
+    """Per row: fractional index where s last rises through `level` before column `stop`."""
+    n, w = s.shape
+    cols = np.arange(w)
+    below = (s < level[:, None]) & (cols[None, :] < stop[:, None])
+    found = below.any(axis=1)
+    i = w - 1 - np.argmax(below[:, ::-1], axis=1)
+    i = np.minimum(i, w - 2)
+    rows = np.arange(n)
+    a, b = s[rows, i], s[rows, i + 1]
+    t = i + (level - a) / np.where(b != a, b - a, np.inf)
+    return np.where(found, t, np.nan)
+
+
+def _first_below_after(s, level, start):
+    """Per row: fractional index where s first falls through `level` after column `start`."""
+    n, w = s.shape
+    cols = np.arange(w)
+    below = (s < level[:, None]) & (cols[None, :] > start[:, None])
+    found = below.any(axis=1)
+    i = np.maximum(np.argmax(below, axis=1), 1)
+    rows = np.arange(n)
+    a, b = s[rows, i - 1], s[rows, i]
+    t = i - 1 + (a - level) / np.where(a != b, a - b, np.inf)
+    return np.where(found, t, np.nan)
+
+
+def snippet_features(rows, pre=PRE_SAMPLES, polarity="Below", dt_ns=1.0, template=None, out=None):
+    """Feature table (FEATURE_DTYPE) of a block of snippets held in memory."""
+    base, noise, s = _signed(rows, pre, polarity)
+    n, w = s.shape
+    feats = np.empty(n, FEATURE_DTYPE) if out is None else out
+    r = np.arange(n)
+
+    peak = np.argmax(s, axis=1)
+    amp = s[r, peak]
+    # Parabolic sub-sample peak position
+    y0 = s[r, np.maximum(peak - 1, 0)]
+    y2 = s[r, np.minimum(peak + 1, w - 1)]
+    denom = y0 - 2 * amp + y2
+    shift = np.where(denom < 0, 0.5 * (y0 - y2) / np.where(denom < 0, denom, -1.0), 0.0)
+
+    lo, hi = 0.1 * amp, 0.9 * amp
+    rise = _last_below_before(s, hi, peak) - _last_below_before(s, lo, peak)
+    fall = _first_below_after(s, lo, peak) - _first_below_after(s, hi, peak)
+
+    feats["baseline"] = base
+    feats["noise"] = noise
+    feats["amplitude"] = amp
+    feats["peak_time"] = (peak + shift - pre) * dt_ns
+    feats["rise"] = rise * dt_ns
+    feats["fall"] = fall * dt_ns
+    feats["area"] = s.sum(axis=1) * dt_ns
+    if template is None:
+        feats["score"] = np.nan
+    else:
+        tc = np.asarray(template, dtype=np.float64) - np.mean(template)
+        sc = s - s.mean(axis=1, keepdims=True)
+        norm = np.sqrt((sc * sc).sum(axis=1) * (tc @ tc))
+        feats["score"] = (sc @ tc) / np.where(norm > 0, norm, np.nan)
+    return feats
+
+
+def mean_template(source, pre=PRE_SAMPLES, polarity="Below", min_snr=5.0,
+                  chunk_rows=DEFAULT_CHUNK_ROWS, name=None):
+    """Mean amplitude-normalized pulse over snippets with amplitude >= min_snr * noise."""
+    data = _as_array(source, name)
+    total = np.zeros(data.shape[1])
+    count = 0
+    for i in range(0, data.shape[0], chunk_rows):
+        _, noise, s = _signed(data[i:i + chunk_rows], pre, polarity)
+        amp = s.max(axis=1)
+        keep = (amp > 0) & (amp >= min_snr * noise)
+        total += (s[keep] / amp[keep, None]).sum(axis=0)
+        count += int(keep.sum())
+    if count == 0:
+        raise ValueError("no snippet passes the template SNR cut")
+    return total / count
+
+
+def extract_features(source, pre=PRE_SAMPLES, polarity="Below", dt_ns=1.0, template="mean",
+                     min_snr=5.0, chunk_rows=DEFAULT_CHUNK_ROWS, name=None):
+    """
+    Features of every snippet of an array, memmap or snippet file (.npy / .npz).
+
+    template: "mean" (built from the data in a first pass), an array of the snippet width,
+              or None (score = NaN).
+    """
+    data = _as_array(source, name)
+    if isinstance(template, str):
+        if template != "mean":
+            raise ValueError(f"template must be 'mean', an array or None, got {template!r}")
+        template = mean_template(data, pre, polarity, min_snr, chunk_rows)
+    feats = np.empty(data.shape[0], FEATURE_DTYPE)
+    for i in range(0, data.shape[0], chunk_rows):
+        snippet_features(data[i:i + chunk_rows], pre, polarity, dt_ns, template,
+                         out=feats[i:i + chunk_rows])
+    return feats
+
+
+def save_features(path, feats):
+    """Write a feature table as a structured .npy (np.load gives it back)."""
+    np.save(path, feats)
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    from Phase_Measure.Analysis.snippet_store import SnippetStore
+
+    rng = np.random.default_rng(0)
+    n, width, pre = 20_000, 1101, 100
+    t = np.arange(width) - pre
+    rise_ns, decay_ns = 2.0, 50.0
+    shape = np.where(t >= 0, (1 - np.exp(-np.maximum(t, 0) / rise_ns)) * np.exp(-np.maximum(t, 0) / decay_ns), 0.0)
+    shape /= shape.max()
+    amps = rng.uniform(0.1, 0.3, n)
+    snips = 0.01 - amps[:, None] * shape + rng.normal(0, 0.002, (n, width))
+    snips[:100] = 0.01 + rng.normal(0, 0.002, (100, width))  # noise-only triggers
+
+    ref = snippet_features(snips[:1000], pre, template=shape)
+    assert np.allclose(ref["baseline"][100:], 0.01, atol=1e-3)
+    assert np.allclose(ref["amplitude"][100:], amps[100:1000], atol=0.01)
+    # Exact 10-90 % of the model pulse for comparison
+    fine = np.linspace(0, 400, 400_001)
+    model = (1 - np.exp(-fine / rise_ns)) * np.exp(-fine / decay_ns)
+    model /= model.max()
+    k = np.argmax(model)
+    rise_true = fine[np.argmax(model >= 0.9)] - fine[np.argmax(model >= 0.1)]
+    fall_true = fine[k + np.argmax(model[k:] <= 0.1)] - fine[k + np.argmax(model[k:] <= 0.9)]
+    assert abs(np.nanmedian(ref["rise"][100:]) - rise_true) < 1.0
+    assert abs(np.nanmedian(ref["fall"][100:]) / fall_true - 1) < 0.05  # noise crosses 10 % early
+    assert np.median(ref["score"][100:]) > 0.95 and np.median(ref["score"][:100]) < 0.5
+
+    with tempfile.TemporaryDirectory() as tmp:
+        npz = os.path.join(tmp, "counts_no_signal_2.npz")
+        np.savez(npz, snips)
+        npy = os.path.join(tmp, "counts_no_signal_2.npy")
+        with SnippetStore(npy, width=width) as store:
+            store.append(snips)
+        assert isinstance(open_snippet_file(npz), np.memmap)
+        # Version 2.0 headers map too; other versions fail with a clear error, not a KeyError
+        for version in ((2, 0), (3, 0)):
+            vnpz = os.path.join(tmp, f"v{version[0]}.npz")
+            with zipfile.ZipFile(vnpz, "w") as zf, zf.open("arr_0.npy", "w") as f:
+                np.lib.format.write_array(f, snips[:10], version=version)
+            try:
+                assert np.array_equal(open_snippet_file(vnpz), snips[:10]) and version == (2, 0)
+            except ValueError as e:
+                assert version == (3, 0) and "version 3.0" in str(e)
+        t0 = time.perf_counter()
+        f_npz = extract_features(npz, pre, chunk_rows=1000)
+        dt = time.perf_counter() - t0
+        f_npy = extract_features(npy, pre, chunk_rows=3000)
+        f_mem = extract_features(snips, pre, chunk_rows=n)
+        for name in FEATURE_DTYPE.names:
+            assert np.allclose(f_npz[name], f_mem[name], equal_nan=True), name
+            assert np.allclose(f_npy[name], f_mem[name], equal_nan=True), name
+        save_features(os.path.join(tmp, "feats.npy"), f_npz)
+        assert np.load(os.path.join(tmp, "feats.npy")).tobytes() == f_npz.tobytes()
+    print(f"OK: {n} snippets x {width} in {dt:.2f} s "
+          f"({FEATURE_DTYPE.itemsize} B/snippet), median rise {np.nanmedian(f_npz['rise']):.2f} ns, "
+          f"fall {np.nanmedian(f_npz['fall']):.1f} ns")
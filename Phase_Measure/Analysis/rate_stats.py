@@ -0,0 +1,210 @@
+"""
+rate_stats.py
+
+Constant-memory click-rate statistics for long SNSPD runs (rate_count.py, STREAMING).
+
+`RateCounter.update(n_per_win, t_in_win)` takes the windows and tags as they arrive
+from the controller, in chunks of any size, and keeps:
+
+- the running rate (all events / all windows so far);
+- a rolling rate over the last `rolling_windows` windows (ring buffer of counts);
+- inter-click interval mean (exact, running sum) and median (log-binned histogram,
+  relative resolution 10**(1/bins_per_decade) - 1, ~1.2% at the default 200 bins);
+- the number of windows truncated at MAX_TAGS (see timetags.py).
+
+Intervals are continued across chunk boundaries and never span a truncated window. The
+absolute timestamps of each chunk are returned, so they can be written to disk and
+dropped, and memory stays bounded by the chunk size:
+
+    counter = RateCounter(WIN_LEN_NS, MAX_TAGS)
+    tags = TagFileWriter("run.tags")                # tagfile.py
+    for n_chunk, t_chunk in iter_ragged(res, "n_per_win", "t_in_win", cap=MAX_TAGS):
+        abs_ts_ns = counter.update(n_chunk, t_chunk)
+        tags.append(abs_ts_ns)
+        print(counter.summary_line())
+    tags.close()
+"""
+
+import numpy as np
+
+from Phase_Measure.Analysis.timetags import (
+    reconstruct_timestamps, truncated_windows, inter_click_intervals,
+)
+
+
+class LogHistogram:
+    """Streaming mean and quantiles of positive values, in a fixed log-spaced histogram."""
+
+    def __init__(self, lo=1.0, hi=1e14, bins_per_decade=200):
+        self.log_lo = np.log10(lo)
+        self.bins_per_decade = bins_per_decade
+        n_bins = int(np.ceil((np.log10(hi) - self.log_lo) * bins_per_decade))
+        # Bin 0 / -1 collect everything below lo / above hi
+        self.counts = np.zeros(n_bins + 2, dtype=np.int64)
+        self.n = 0
+        self.total = 0.0
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        if values.size == 0:
+            return
+        with np.errstate(divide="ignore"):
+            pos = (np.log10(np.maximum(values, 0)) - self.log_lo) * self.bins_per_decade
+        idx = np.clip(np.floor(pos), -1, self.counts.size - 2).astype(np.int64) + 1
+        self.counts += np.bincount(idx, minlength=self.counts.size)
+        self.n += values.size
+        self.total += float(values.sum())
+
+    @property
+    def mean(self):
+        return self.total / self.n if self.n else float("nan")
+
+    def quantile(self, q):
+        """Quantile, interpolated log-linearly within the bin that contains it."""
+        if self.n == 0:
+            return float("nan")
+        cum = np.cumsum(self.counts)
+        target = q * self.n
+        b = int(np.searchsorted(cum, target, side="left"))
+        below = cum[b - 1] if b else 0
+        frac = (target - below) / self.counts[b] if self.counts[b] else 0.0
+        b = min(max(b, 1), self.counts.size - 2)  # under/overflow: report the edge
+        return 10 ** (self.log_lo + (b - 1 + frac) / self.bins_per_decade)
+
+    @property
+    def median(self):
+        return self.quantile(0.5)
+
+
+class RateCounter:
+    """Online rate / interval statistics over a stream of tagging windows."""
+
+    def __init__(self, win_len_ns, max_tags=None, rolling_windows=60, bins_per_decade=200):
+        self.win_len_ns = win_len_ns
+        self.max_tags = max_tags
+        self.n_windows = 0
+        self.n_events = 0
+        self.n_truncated = 0
+        self._ring = np.zeros(rolling_windows, dtype=np.int64)
+        self.intervals_ns = LogHistogram(bins_per_decade=bins_per_decade)
+        # Last kept timestamp and its window, to continue intervals into the next chunk
+        self._last = None
+
+    # --- update
+    def update(self, n_per_win, t_in_win_ns):
+        """Add a chunk of windows; returns their absolute timestamps (ns, int64)."""
+        n_per_win = np.asarray(n_per_win, dtype=np.int64)
+        first = self.n_windows
+        abs_ts_ns, windows = reconstruct_timestamps(
+            n_per_win, t_in_win_ns, self.win_len_ns, max_tags=self.max_tags,
+            return_windows=True, first_window=first,
+        )
+        bad = (truncated_windows(n_per_win, self.max_tags) if self.max_tags is not None
+               else np.array([], dtype=np.int64))
+
+        # Intervals, including the one from the previous chunk's last tag. Windows are
+        # made relative to the chunk (previous tag -> window 0, chunk window k -> k + 1).
+        rel_ts, rel_win = abs_ts_ns, windows - first + 1
+        if self._last is not None:
+            rel_ts = np.concatenate(([self._last[0]], abs_ts_ns))
+            rel_win = np.concatenate(([0], rel_win))
+        dt = inter_click_intervals(rel_ts, rel_win, n_per_win.size + 1, bad + 1)
+        self.intervals_ns.add(dt)
+
+        if abs_ts_ns.size:
+            self._last = (abs_ts_ns[-1], windows[-1])
+        if self._last is not None and bad.size and first + bad[-1] > self._last[1]:
+            self._last = None  # a truncated window follows the last tag
+
+        self._push_ring(n_per_win)
+        self.n_windows += n_per_win.size
+        self.n_events += int(n_per_win.sum())
+        self.n_truncated += bad.size
+        return abs_ts_ns
+
+    def _push_ring(self, counts):
+        k = self._ring.size
+        start = self.n_windows
+        if counts.size > k:
+            start += counts.size - k
+            counts = counts[-k:]
+        idx = (start + np.arange(counts.size)) % k
+        self._ring[idx] = counts
+
+    # --- results
+    @property
+    def elapsed_s(self):
+        return self.n_windows * self.win_len_ns * 1e-9
+
+    @property
+    def rate_hz(self):
+        return self.n_events / self.elapsed_s if self.n_windows else float("nan")
+
+    @property
+    def rolling_rate_hz(self):
+        n = min(self.n_windows, self._ring.size)
+        return self._ring.sum() / (n * self.win_len_ns * 1e-9) if n else float("nan")
+
+    @property
+    def interval_median_s(self):
+        return self.intervals_ns.median * 1e-9
+
+    @property
+    def interval_mean_s(self):
+        return self.intervals_ns.mean * 1e-9
+
+    def summary(self):
+        return {
+            "windows": self.n_windows,
+            "elapsed_s": self.elapsed_s,
+            "events": self.n_events,
+            "rate_hz": self.rate_hz,
+            "rolling_rate_hz": self.rolling_rate_hz,
+            "interval_median_s": self.interval_median_s,
+            "interval_mean_s": self.interval_mean_s,
+            "intervals": self.intervals_ns.n,
+            "truncated_windows": self.n_truncated,
+        }
+
+    def summary_line(self):
+        s = self.summary()
+        n_roll = min(self.n_windows, self._ring.size)
+        return (f"[{s['elapsed_s']:9.1f} s] {s['events']} events, "
+                f"rate {s['rate_hz']:.4f} Hz (last {n_roll} win: {s['rolling_rate_hz']:.4f} Hz), "
+                f"interval median {s['interval_median_s']:.6f} s / mean {s['interval_mean_s']:.6f} s"
+                + (f", {s['truncated_windows']} truncated windows" if s["truncated_windows"] else ""))
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(1)
+    win, cap = 10**9, 8
+    n_per_win = rng.poisson(3.0, 5000)
+    n_per_win[[10, 11, 2000]] = cap + 2
+    first = np.repeat(np.cumsum(n_per_win) - n_per_win, n_per_win)
+    slot = np.arange(n_per_win.sum()) - first
+    win_id = np.repeat(np.arange(n_per_win.size), n_per_win)
+    t = rng.integers(0, win, n_per_win.sum())
+    t = t[np.lexsort((t, win_id))][slot < cap]  # ascending within each window
+
+    # Whole-array reference
+    ts, w = reconstruct_timestamps(n_per_win, t, win, max_tags=cap, return_windows=True)
+    bad = truncated_windows(n_per_win, cap)
+    dt = inter_click_intervals(ts, w, n_per_win.size, bad)
+
+    counter = RateCounter(win, cap, rolling_windows=100)
+    pos_w = pos_t = 0
+    out = []
+    for size in rng.integers(1, 300, 100):
+        nw = n_per_win[pos_w:pos_w + size]
+        nt = int(np.minimum(nw, cap).sum())
+        out.append(counter.update(nw, t[pos_t:pos_t + nt]))
+        pos_w, pos_t = pos_w + nw.size, pos_t + nt
+    out.append(counter.update(n_per_win[pos_w:], t[pos_t:]))
+
+    assert np.array_equal(np.concatenate(out), ts)
+    assert counter.intervals_ns.n == dt.size
+    assert np.isclose(counter.interval_mean_s, dt.mean() * 1e-9)
+    assert abs(counter.interval_median_s / (np.median(dt) * 1e-9) - 1) < 0.012
+    assert counter.n_truncated == bad.size
+    assert np.isclose(counter.rolling_rate_hz, n_per_win[-100:].mean())
+    print(counter.summary_line())
@@ -0,0 +1,154 @@
+"""
+snippet_store.py
+
+Append-only on-disk store for fixed-width snippets (e.g. dark-count pulses cut out of
+raw ADC traces by continuous_capture.py).
+
+The file is a plain `.npy` file with a fixed-size (padded) header, so:
+- each `append()` writes only the new rows at the end of the file and then rewrites
+  the row count in the header (no copy of the existing data, O(new rows) I/O);
+- the data are fsync'ed *before* the header is updated, so after a crash the header
+  never claims rows that were not written. Any partially written trailing rows are
+  discarded when the file is reopened;
+- the result can be opened anywhere with `np.load(path, mmap_mode="r")` without
+  loading everything into memory (see `open_snippets`).
+"""
+
+import os
+import ast
+
+import numpy as np
+
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+HEADER_LEN = 256  # total bytes before the data (magic + length + padded dict), multiple of 64
+
+
+def _header_bytes(dtype, n_rows, width):
+    d = {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False,
+         "shape": (int(n_rows), int(width))}
+    text = repr(d)
+    pad = HEADER_LEN - len(NPY_MAGIC) - 2 - len(text) - 1
+    if pad < 0:
+        raise ValueError("npy header does not fit in the reserved space")
+    text = text + " " * pad + "\n"
+    return NPY_MAGIC + np.uint16(len(text)).astype("<u2").tobytes() + text.encode("latin1")
+
+
+def _read_header(f):
+    f.seek(0)
+    head = f.read(HEADER_LEN)
+    if len(head) < HEADER_LEN or not head.startswith(NPY_MAGIC):
+        raise ValueError(f"{f.name} is not a snippet store (bad or short header)")
+    hlen = int(np.frombuffer(head[len(NPY_MAGIC):len(NPY_MAGIC) + 2], dtype="<u2")[0])
+    if len(NPY_MAGIC) + 2 + hlen != HEADER_LEN:
+        raise ValueError(f"{f.name} was not written by SnippetStore (header length {hlen})")
+    d = ast.literal_eval(head[len(NPY_MAGIC) + 2:].decode("latin1").strip())
+    n_rows, width = d["shape"]
+    return np.dtype(d["descr"]), n_rows, width
+
+
+class SnippetStore:
+    """
+    Append-only (n_rows, width) array on disk.
+
+        with SnippetStore("counts_no_signal_2.npy", width=1100) as store:
+            store.append(snippets)          # (k, 1100) array, k may be 0
+
+    Reopening an existing file continues appending after the last complete row.
+    """
+
+    def __init__(self, path, width, dtype=np.float64, fsync=True):
+        self.path = os.fspath(path)
+        self.width = int(width)
+        self.dtype = np.dtype(dtype)
+        self.fsync = fsync
+
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            self._f = open(self.path, "r+b")
+            dtype_on_disk, n_rows, width_on_disk = _read_header(self._f)
+            if dtype_on_disk != self.dtype or width_on_disk != self.width:
+                self._f.close()
+                raise ValueError(
+                    f"{self.path} holds {dtype_on_disk} x {width_on_disk}, "
+                    f"not {self.dtype} x {self.width}"
+                )
+            self.n_rows = n_rows
+            # Drop rows written after the last header update (crash mid-append)
+            self._f.truncate(HEADER_LEN + self.n_rows * self.row_bytes)
+        else:
+            self._f = open(self.path, "w+b")
+            self.n_rows = 0
+            self._f.write(_header_bytes(self.dtype, 0, self.width))
+            self._sync()
+
+    @property
+    def row_bytes(self):
+        return self.width * self.dtype.itemsize
+
+    def __len__(self):
+        return self.n_rows
+
+    def append(self, rows):
+        """Append a (k, width) block (or a single row). Returns the new row count."""
+        rows = np.asarray(rows, dtype=self.dtype)
+        if rows.ndim == 1:
+            rows = rows[None, :]
+        if rows.ndim != 2 or rows.shape[1] != self.width:
+            raise ValueError(f"expected rows of width {self.width}, got shape {rows.shape}")
+        if rows.shape[0] == 0:
+            return self.n_rows
+
+        self._f.seek(HEADER_LEN + self.n_rows * self.row_bytes)
+        self._f.write(np.ascontiguousarray(rows).tobytes())
+        self._sync()
+
+        # Only now publish the new rows
+        self.n_rows += rows.shape[0]
+        self._f.seek(0)
+        self._f.write(_header_bytes(self.dtype, self.n_rows, self.width))
+        self._sync()
+        return self.n_rows
+
+    def _sync(self):
+        self._f.flush()
+        if self.fsync:
+            os.fsync(self._f.fileno())
+
+    def close(self):
+        if not self._f.closed:
+            self._sync()
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_snippets(path, mode="r"):
+    """Memory-map a snippet store (or any .npy) without loading it."""
+    return np.load(path, mmap_mode=mode)
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "snips.npy")
+        rng = np.random.default_rng(1)
+        blocks = [rng.normal(size=(k, 1100)) for k in (3, 0, 5, 1)]
+        with SnippetStore(path, width=1100) as store:
+            for b in blocks:
+                store.append(b)
+
+        # Simulate a crash after writing data but before the header update
+        with open(path, "ab") as f:
+            f.write(b"\x00" * 1234)
+        with SnippetStore(path, width=1100) as store:
+            store.append(blocks[0])
+
+        data = open_snippets(path)
+        expected = np.concatenate(blocks + [blocks[0]])
+        assert isinstance(data, np.memmap) and np.array_equal(data, expected)
+        print(f"OK: {data.shape} rows round-tripped through {path}")
@@ -0,0 +1,286 @@
+"""
+tagfile.py
+
+Compact on-disk format for absolute SNSPD time tags (int64 ns, non-decreasing), as
+written by rate_count.py.
+
+Layout (little-endian):
+
+    file header   8 B magic + 8 B reserved
+    chunk         24 B header: first tag (int64), last tag (int64), n (uint32),
+                  delta width in bytes (uint8), 3 B padding
+                  (n - 1) deltas, each stored in `width` bytes (the smallest of
+                  0, 1, 2, 4, 8 that holds the largest delta of the chunk)
+    ...
+    index         per chunk: offset, first tag, last tag, n (4 x int64)
+    trailer       number of chunks (int64), index offset (int64), 8 B end magic
+
+Each chunk is encoded/decoded in a few vectorized NumPy operations; the deltas are read
+in place as <u1/<u2/<u4/<i8 and summed straight into the int64 output. At ~1e3 ns between
+tags (MHz rates) deltas take 2 bytes instead of 8; at Hz rates 4. The index is written
+on `close()`; if it is missing (crash) the reader rebuilds it by walking the chunk
+headers, so everything up to the last complete chunk is recoverable.
+
+Measured on 2M tags at ~1 MHz (the self-check below): the file is 4x smaller than raw
+int64, and a full read is ~15x faster than np.loadtxt of one tag per line and ~40x
+faster than json-parsing a printed list.
+
+`TagFile` memory-maps the file and uses the index to decode only the chunks that
+overlap a requested time range:
+
+    with TagFileWriter("run.tags") as w:
+        w.append(abs_ts_ns)                 # any number of calls
+    tf = TagFile("run.tags")
+    ts = tf.read(10e9, 20e9)                # tags in [10 s, 20 s)
+"""
+
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b"HTAGS\x00\x01\x00"
+END_MAGIC = b"HTAGIDX\x00"
+FILE_HEADER = MAGIC + bytes(8)
+CHUNK_HEADER = struct.Struct("<qqIB3x")
+TRAILER = struct.Struct("<qq8s")
+INDEX_DTYPE = np.dtype([("offset", "<i8"), ("first", "<i8"), ("last", "<i8"), ("n", "<i8")])
+DEFAULT_CHUNK_TAGS = 65536
+DELTA_DTYPES = {1: "<u1", 2: "<u2", 4: "<u4", 8: "<i8"}  # deltas of int64 tags fit in int64
+
+
+def _delta_width(max_delta):
+    """Bytes per delta: the smallest of 0, 1, 2, 4, 8 that holds max_delta."""
+    nbytes = (int(max_delta).bit_length() + 7) // 8
+    return next(w for w in (0, 1, 2, 4, 8) if w >= nbytes)
+
+
+def encode_chunk(ts):
+    """Chunk bytes (header + packed deltas) for a non-decreasing int64 array."""
+    ts = np.asarray(ts, dtype=np.int64)
+    deltas = np.diff(ts)
+    if deltas.size and deltas.min() < 0:
+        raise ValueError("time tags must be non-decreasing")
+    width = _delta_width(deltas.max()) if deltas.size else 0
+    head = CHUNK_HEADER.pack(int(ts[0]), int(ts[-1]), ts.size, width)
+    return head + (deltas.astype(DELTA_DTYPES[width]).tobytes() if width else b"")
+
+
+def decode_chunk(buf, offset, out=None):
+    """
+    Decode the chunk at `offset` of a uint8 buffer; returns (tags, next offset). The tags
+    are written into `out` (int64, at least n long) if given.
+    """
+    first, _, n, width = CHUNK_HEADER.unpack_from(buf, offset)
+    start = offset + CHUNK_HEADER.size
+    stop = start + (n - 1) * width
+    ts = np.empty(n, dtype=np.int64) if out is None else out[:n]
+    ts[0] = first
+    if n > 1:
+        if width in DELTA_DTYPES:
+            deltas = np.frombuffer(buf, DELTA_DTYPES[width], n - 1, start)
+            np.cumsum(deltas, dtype=np.int64, out=ts[1:])
+            ts[1:] += first
+        elif width:
+            # 3/5/6/7-byte deltas (files from before the widths were rounded up): pad to 8
+            wide = np.zeros((n - 1, 8), dtype=np.uint8)
+            wide[:, :width] = np.frombuffer(buf, np.uint8, stop - start, start).reshape(n - 1, width)
+            np.cumsum(wide.view("<i8").ravel(), out=ts[1:])
+            ts[1:] += first
+        else:
+            ts[1:] = first
+    return ts, stop
+
+
+class TagFileWriter:
+    """Append time tags to a new tag file, in chunks of `chunk_tags`."""
+
+    def __init__(self, path, chunk_tags=DEFAULT_CHUNK_TAGS, fsync=False):
+        self.path = path
+        self.chunk_tags = chunk_tags
+        self.fsync = fsync
+        self._f = open(path, "wb")
+        self._f.write(FILE_HEADER)
+        self._pending = []
+        self._n_pending = 0
+        self._last = None
+        self._index = []
+        self.n_tags = 0
+
+    def __len__(self):
+        return self.n_tags
+
+    def append(self, ts):
+        ts = np.asarray(ts, dtype=np.int64).reshape(-1)
+        if ts.size == 0:
+            return
+        if (self._last is not None and ts[0] < self._last) or np.any(np.diff(ts) < 0):
+            raise ValueError("time tags must be appended in non-decreasing order")
+        self._last = ts[-1]
+        self._pending.append(ts)
+        self._n_pending += ts.size
+        self.n_tags += ts.size
+        if self._n_pending >= self.chunk_tags:
+            buf = np.concatenate(self._pending)
+            n_full = buf.size - buf.size % self.chunk_tags
+            for i in range(0, n_full, self.chunk_tags):
+                self._write_chunk(buf[i:i + self.chunk_tags])
+            self._pending = [buf[n_full:]] if n_full < buf.size else []
+            self._n_pending = buf.size - n_full
+
+    def _write_chunk(self, ts):
+        offset = self._f.tell()
+        self._f.write(encode_chunk(ts))
+        self._index.append((offset, ts[0], ts[-1], ts.size))
+
+    def flush(self):
+        """Write the buffered tags as a (short) chunk and flush to disk."""
+        if self._n_pending:
+            self._write_chunk(np.concatenate(self._pending))
+            self._pending, self._n_pending = [], 0
+        self._f.flush()
+        if self.fsync:
+            os.fsync(self._f.fileno())
+
+    def close(self):
+        if self._f.closed:
+            return
+        self.flush()
+        index_offset = self._f.tell()
+        self._f.write(np.array(self._index, dtype=INDEX_DTYPE).tobytes())
+        self._f.write(TRAILER.pack(len(self._index), index_offset, END_MAGIC))
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TagFile:
+    """Memory-mapped reader: decode any time range without touching the other chunks."""
+
+    def __init__(self, path):
+        self.path = path
+        self._buf = np.memmap(path, dtype=np.uint8, mode="r")
+        if self._buf.size < len(FILE_HEADER) or bytes(self._buf[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a tag file")
+        self.index = self._read_index()
+
+    def _read_index(self):
+        buf = self._buf
+        if buf.size >= len(FILE_HEADER) + TRAILER.size:
+            n_chunks, index_offset, end = TRAILER.unpack_from(buf, buf.size - TRAILER.size)
+            if end == END_MAGIC and index_offset + n_chunks * INDEX_DTYPE.itemsize == buf.size - TRAILER.size:
+                return np.frombuffer(buf, INDEX_DTYPE, n_chunks, index_offset)
+        return self._scan_index()
+
+    def _scan_index(self):
+        """Rebuild the index from the chunk headers (file not closed properly)."""
+        buf, pos, rows = self._buf, len(FILE_HEADER), []
+        while pos + CHUNK_HEADER.size <= buf.size:
+            first, last, n, width = CHUNK_HEADER.unpack_from(buf, pos)
+            stop = pos + CHUNK_HEADER.size + (n - 1) * width
+            if n == 0 or width > 8 or stop > buf.size:
+                break  # partially written chunk
+            rows.append((pos, first, last, n))
+            pos = stop
+        return np.array(rows, dtype=INDEX_DTYPE)
+
+    def __len__(self):
+        return int(self.index["n"].sum())
+
+    @property
+    def t_first(self):
+        return int(self.index["first"][0]) if self.index.size else None
+
+    @property
+    def t_last(self):
+        return int(self.index["last"][-1]) if self.index.size else None
+
+    def chunk(self, i):
+        return decode_chunk(self._buf, int(self.index["offset"][i]))[0]
+
+    def iter_chunks(self):
+        for i in range(self.index.size):
+            yield self.chunk(i)
+
+    def read(self, t_start=None, t_stop=None):
+        """Tags with t_start <= t < t_stop (ns); None = open-ended."""
+        lo = 0 if t_start is None else int(np.searchsorted(self.index["last"], t_start, "left"))
+        hi = self.index.size if t_stop is None else int(np.searchsorted(self.index["first"], t_stop, "left"))
+        if hi <= lo:
+            return np.array([], dtype=np.int64)
+        # Decode the chunks straight into one output array
+        ts = np.empty(int(self.index["n"][lo:hi].sum()), dtype=np.int64)
+        pos = 0
+        for offset, n in zip(self.index["offset"][lo:hi].tolist(), self.index["n"][lo:hi].tolist()):
+            decode_chunk(self._buf, offset, ts[pos:pos + n])
+            pos += n
+        a = 0 if t_start is None else np.searchsorted(ts, t_start, "left")
+        b = ts.size if t_stop is None else np.searchsorted(ts, t_stop, "left")
+        return ts[a:b]
+
+    def read_all(self):
+        return self.read()
+
+
+if __name__ == "__main__":
+    import json
+    import tempfile
+    import time
+
+    def _timed(f):
+        t = time.perf_counter()
+        f()
+        return time.perf_counter() - t
+
+    rng = np.random.default_rng(0)
+    ts = np.cumsum(rng.exponential(1e3, 2_000_000).astype(np.int64))  # 1 us mean interval: ~1 MHz clicks
+    ts[1000:1003] = ts[999]  # repeated tags
+
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "t.tags")
+        with TagFileWriter(path, chunk_tags=50_000) as w:
+            for part in np.array_split(ts, 37):
+                w.append(part)
+        tf = TagFile(path)
+        assert len(tf) == ts.size and np.array_equal(tf.read_all(), ts)
+        t0, t1 = ts[123_456], ts[1_500_000]
+        assert np.array_equal(tf.read(t0, t1), ts[(ts >= t0) & (ts < t1)])
+
+        # Every delta width, including the odd widths of older files
+        for width in range(9):
+            d_max = 0 if width == 0 else 2 ** min(8 * width - 1, 62)
+            part = np.concatenate(([5], 5 + np.cumsum(np.minimum(rng.integers(0, 1000, 99), d_max))))
+            part[-1] = part[-2] + d_max
+            head = CHUNK_HEADER.pack(int(part[0]), int(part[-1]), part.size, width)
+            packed = np.diff(part).astype("<u8").view(np.uint8).reshape(-1, 8)[:, :width]
+            for chunk in (encode_chunk(part), head + packed.tobytes()):
+                out, stop = decode_chunk(np.frombuffer(chunk, np.uint8), 0)
+                assert np.array_equal(out, part) and stop == len(chunk), width
+
+        # Unclosed file: the index is rebuilt from the chunk headers
+        w = TagFileWriter(path + "2", chunk_tags=50_000)
+        w.append(ts[:175_000])
+        w._f.flush()
+        assert np.array_equal(TagFile(path + "2").read_all(), ts[:150_000])
+        w.close()
+
+        npy, txt = os.path.join(d, "t.npy"), os.path.join(d, "t.txt")
+        np.save(npy, ts)
+        np.savetxt(txt, ts, fmt="%d")
+        lst = os.path.join(d, "t_list.txt")  # the printed Python list rate_count.py used to give
+        with open(lst, "w") as f:
+            f.write(repr(ts.tolist()))
+        t_tag = min(_timed(lambda: TagFile(path).read_all()) for _ in range(5))
+        t_txt = _timed(lambda: np.loadtxt(txt, dtype=np.int64))
+        t_lst = _timed(lambda: np.array(json.loads(open(lst).read()), dtype=np.int64))
+        size_ratio = os.path.getsize(npy) / os.path.getsize(path)
+        print(f"{ts.size} tags: {os.path.getsize(path) / 2**20:.1f} MB vs "
+              f"{os.path.getsize(npy) / 2**20:.1f} MB raw int64 ({size_ratio:.1f}x smaller); "
+              f"read {t_tag * 1e3:.1f} ms vs {t_txt * 1e3:.0f} ms np.loadtxt ({t_txt / t_tag:.0f}x), "
+              f"{t_lst * 1e3:.0f} ms list literal ({t_lst / t_tag:.0f}x)")
+        assert size_ratio > 3.5, size_ratio
+        assert t_txt / t_tag > 8 and t_lst / t_tag > 20, (t_txt / t_tag, t_lst / t_tag)
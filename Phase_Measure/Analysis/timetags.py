@@ -0,0 +1,157 @@
+"""
+timetags.py
+
+Host-side handling of SNSPD time tags streamed by rate_count.py.
+
+The controller streams `n_per_win` (counts per tagging window) and `t_in_win` (the
+in-window timestamps of all windows, flattened in window order). Absolute timestamps
+are rebuilt on the host as int64:
+
+    abs_t = t_in_win + window_index * WIN_LEN
+
+The window index of every tag is the window offsets expanded by the counts
+(`np.repeat`), so there is no per-window Python work. Tags come out of the time tagger
+in ascending order within a window and windows are streamed in order, so the result is
+already sorted.
+
+A window can see more events than the tag array holds (`n_tags > MAX_TAGS`). The
+controller only streams the first MAX_TAGS tags of such a window (the save loop in
+rate_count.py is capped), so its timestamps are incomplete: `truncated_windows()` finds
+those windows and `reconstruct_timestamps(..., max_tags=...)` drops their tags by
+default, so truncated data is never silently mixed into the interval statistics.
+
+With several tagging channels (one n_per_win / t_in_win stream pair each),
+`reconstruct_channels` rebuilds all of them with a single repeat/add over the
+concatenated streams.
+"""
+
+import numpy as np
+
+
+def truncated_windows(n_per_win, max_tags):
+    """Indices of the windows whose count exceeded the tag array size."""
+    return np.flatnonzero(np.asarray(n_per_win) > max_tags)
+
+
+def reconstruct_timestamps(n_per_win, t_in_win_ns, win_len_ns, max_tags=None,
+                           drop_truncated=True, return_windows=False, first_window=0):
+    """
+    Absolute int64 timestamps (ns) from per-window counts and flat in-window tags.
+
+    max_tags:       tag array size; the stream then holds min(n, max_tags) tags per
+                    window. None: the stream holds exactly n tags per window.
+    drop_truncated: leave out the tags of windows with n > max_tags.
+    return_windows: also return the window index of every timestamp.
+    first_window:   index of the first window (when reconstructing a chunk of a stream).
+    """
+    n_per_win = np.asarray(n_per_win, dtype=np.int64)
+    t_in_win_ns = np.asarray(t_in_win_ns, dtype=np.int64)
+
+    counts = np.maximum(n_per_win, 0)
+    if max_tags is not None:
+        counts = np.minimum(counts, max_tags)
+    if counts.sum() != t_in_win_ns.size:
+        raise ValueError(f"{t_in_win_ns.size} tags streamed but the window counts add up "
+                         f"to {counts.sum()} (max_tags={max_tags})")
+
+    windows = np.repeat(np.arange(first_window, first_window + n_per_win.size, dtype=np.int64),
+                        counts)
+    abs_ts_ns = t_in_win_ns + windows * np.int64(win_len_ns)
+
+    if max_tags is not None and drop_truncated:
+        keep = np.repeat(n_per_win <= max_tags, counts)
+        if not keep.all():
+            abs_ts_ns, windows = abs_ts_ns[keep], windows[keep]
+
+    return (abs_ts_ns, windows) if return_windows else abs_ts_ns
+
+
+def reconstruct_channels(n_per_win, t_in_win_ns, win_len_ns, max_tags=None, drop_truncated=True):
+    """
+    Absolute timestamps of several channels in one pass.
+
+    n_per_win:   (n_channels, n_windows) counts
+    t_in_win_ns: sequence of the channels' flat in-window tag arrays
+    Returns a list of (abs_ts_ns, windows) per channel (see reconstruct_timestamps).
+    """
+    n_per_win = np.atleast_2d(np.asarray(n_per_win, dtype=np.int64))
+    n_ch, n_win = n_per_win.shape
+    counts = np.maximum(n_per_win, 0)
+    if max_tags is not None:
+        counts = np.minimum(counts, max_tags)
+    per_ch = counts.sum(axis=1)
+    sizes = [len(t) for t in t_in_win_ns]
+    if len(sizes) != n_ch or not np.array_equal(per_ch, sizes):
+        raise ValueError(f"streamed tags per channel {sizes} do not match the window counts "
+                         f"{per_ch.tolist()} (max_tags={max_tags})")
+
+    # Channel c, window k -> flat window c * n_win + k
+    flat = np.repeat(np.arange(n_ch * n_win, dtype=np.int64), counts.ravel())
+    windows = flat % n_win
+    abs_ts_ns = np.concatenate([np.asarray(t, dtype=np.int64) for t in t_in_win_ns]) \
+        + windows * np.int64(win_len_ns)
+
+    bounds = np.cumsum(per_ch)[:-1]
+    if max_tags is not None and drop_truncated:
+        keep = np.repeat((n_per_win <= max_tags).ravel(), counts.ravel())
+        if not keep.all():
+            abs_ts_ns, windows = abs_ts_ns[keep], windows[keep]
+            bounds = np.cumsum(np.bincount(flat[keep] // n_win, minlength=n_ch))[:-1]
+    return list(zip(np.split(abs_ts_ns, bounds), np.split(windows, bounds)))
+
+
+def inter_click_intervals(abs_ts_ns, windows, n_windows, bad_windows=()):
+    """
+    Intervals (ns) between consecutive timestamps, skipping the pairs that straddle a
+    window in `bad_windows` (whose tags were dropped, so the interval is not real).
+    """
+    dt = np.diff(abs_ts_ns)
+    if len(bad_windows) == 0 or dt.size == 0:
+        return dt
+    bad = np.zeros(n_windows + 1, dtype=np.int64)
+    bad[np.asarray(bad_windows) + 1] = 1
+    n_bad_before = np.cumsum(bad)  # number of bad windows with index < k, at [k]
+    # Bad windows strictly between the windows of tag j and tag j+1
+    between = n_bad_before[windows[1:]] - n_bad_before[windows[:-1] + 1]
+    return dt[between == 0]
+
+
+def _reconstruct_timestamps_loop(n_per_win, t_in_win_ns, win_len_ns):
+    """Original per-window loop from rate_count.py, kept as a reference for the benchmark."""
+    abs_ts_ns_chunks = []
+    idx = 0
+    for k, n in enumerate(n_per_win):
+        if n <= 0:
+            continue
+        ts_chunk = t_in_win_ns[idx: idx + n]
+        abs_ts_ns_chunks.append(ts_chunk + np.int64(k) * np.int64(win_len_ns))
+        idx += n
+
+    return np.concatenate(abs_ts_ns_chunks) if abs_ts_ns_chunks else np.array([], dtype=np.int64)
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    win, cap = 10**9, 8
+    n_per_win = rng.poisson(4.0, 10_000)
+    n_per_win[[3, 17]] = [0, cap + 5]
+    t_full = rng.integers(0, win, n_per_win.sum())
+    ref = _reconstruct_timestamps_loop(n_per_win, t_full, win)
+    assert np.array_equal(reconstruct_timestamps(n_per_win, t_full, win), ref)
+
+    # Capped stream: only the first `cap` tags of each window
+    first = np.repeat(np.cumsum(n_per_win) - n_per_win, n_per_win)
+    slot = np.arange(t_full.size) - first
+    t_capped = t_full[slot < cap]
+    bad = truncated_windows(n_per_win, cap)
+    ts, w = reconstruct_timestamps(n_per_win, t_capped, win, max_tags=cap, return_windows=True)
+    assert not np.isin(w, bad).any()
+    assert np.array_equal(ts, ref[~np.isin(np.repeat(np.arange(n_per_win.size), n_per_win), bad)])
+    dt = inter_click_intervals(ts, w, n_per_win.size, bad)
+    ref_dt = [ts[j + 1] - ts[j] for j in range(ts.size - 1)
+              if not any(w[j] < b < w[j + 1] for b in bad)]
+    assert np.array_equal(dt, ref_dt)
+    # Two channels in one pass
+    chans = reconstruct_channels(np.stack([n_per_win, n_per_win]), [t_capped, t_capped], win, cap)
+    assert all(np.array_equal(c[0], ts) and np.array_equal(c[1], w) for c in chans)
+    print(f"OK: {ts.size} tags, {bad.size} truncated windows, {dt.size} intervals")
@@ -0,0 +1,106 @@
+"""
+config_cache.py
+
+Canonical fingerprints of QUA config dicts, and a QM cache keyed on them.
+
+`config_fingerprint(config)` hashes a normalized copy of the config, so the result does
+not depend on key order, on `1` vs `"1"` port/FEM keys, on tuples vs lists, or on
+`4e3` vs `4000`. Two configs with the same fingerprint open identical QMs.
+
+`QMCache` uses it to skip redundant `open_qm` calls:
+- in-process: the same config returns the same QM handle;
+- across runs: the QM id opened for each fingerprint is remembered in a small JSON
+  file; if that QM is still open on the server it is re-attached with
+  `qmm.get_qm(id)` instead of being reopened.
+
+Only a real config change triggers `open_qm`. Compiled programs are cached per
+(program, fingerprint) by `ProgramRunner` (qm_exec.py).
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "heterodyne_qm_ids.json")
+
+
+def canonical_config(obj):
+    """Normalized, JSON-serializable copy of a config (or any part of it)."""
+    if isinstance(obj, dict):
+        return {str(k): canonical_config(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [canonical_config(v) for v in obj]
+    if isinstance(obj, np.ndarray):
+        return [canonical_config(v) for v in obj.tolist()]
+    if isinstance(obj, (bool, np.bool_)):
+        return bool(obj)
+    if isinstance(obj, (int, np.integer)):
+        return int(obj)
+    if isinstance(obj, (float, np.floating)):
+        obj = float(obj)
+        return int(obj) if obj.is_integer() else obj
+    return obj
+
+
+def config_fingerprint(config):
+    """Order-independent SHA-256 hex digest of a config dict."""
+    text = json.dumps(canonical_config(config), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class QMCache:
+    """Open QMs through `qmm`, reusing the existing one when the config is unchanged."""
+
+    def __init__(self, qmm, path=DEFAULT_CACHE_PATH):
+        self.qmm = qmm
+        self.path = path
+        self.fingerprint = None
+        self.qm = None
+
+    def _load_ids(self):
+        if self.path is None or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _store_id(self, fingerprint, qm_id):
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            # One QM is open at a time (open_qm closes the others), so keep one entry
+            json.dump({fingerprint: qm_id}, f)
+        os.replace(tmp, self.path)
+
+    def _reattach(self, fingerprint):
+        qm_id = self._load_ids().get(fingerprint)
+        if qm_id is None:
+            return None
+        try:
+            if qm_id in self.qmm.list_open_qms():
+                return self.qmm.get_qm(qm_id)
+        except Exception:
+            pass  # server restarted / id unknown: fall back to opening
+        return None
+
+    def open_qm(self, config):
+        """Return an open QM for `config`; calls `qmm.open_qm` only if the config changed."""
+        fp = config_fingerprint(config)
+        if fp == self.fingerprint and self.qm is not None:
+            return self.qm
+
+        qm = self._reattach(fp)
+        if qm is None:
+            qm = self.qmm.open_qm(config)
+            qm_id = getattr(qm, "id", None)
+            if qm_id is not None:
+                self._store_id(fp, qm_id)
+
+        self.fingerprint, self.qm = fp, qm
+        return qm
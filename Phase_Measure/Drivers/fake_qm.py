@@ -0,0 +1,625 @@
+"""
+fake_qm.py
+
+Offline stand-in for QuantumMachinesManager / QM / job / result handles that "runs" the
+QUA programs in this repo and synthesizes realistic data, so host-side code can be
+exercised and benchmarked without the OPX:
+
+- `demod.full("cos"/"sin")` on an IQ element while references are played (the
+  `lf_in1_iq` programs): heterodyne beat-note I/Q with a phase ramp from any beat/demod
+  frequency mismatch, linear + random-walk phase drift and additive noise;
+- `time_tagging.analog(...)` (rate_count.py): Poisson clicks per window, in-window
+  timestamps in ns, n_tags = true count (tags beyond the array size are undefined on
+  the controller and come back as 0 here; a tag loop capped with
+  `(i < n_tags) & (i < MAX_TAGS)` only saves the tags that fit);
+- `adc_stream=` raw ADC traces (continuous_capture.py): baseline noise with negative
+  SNSPD-like pulses, or the beat tone if references are played.
+
+The program is read back from `generate_qua_script(program)` into a loop / measure /
+save tree; each measurement is then evaluated vectorized over its whole loop grid, so
+millions of shots take a fraction of a second. Supported stream processing:
+`input1/input2`, `buffer(...)`, `map(FUNCTIONS.average(...) / dot_product(...))`,
+`average()`, `save` and `save_all`.
+
+Drop-in usage:
+
+    qmm = FakeQuantumMachinesManager(click_rate_hz=5.0)
+    qm = qmm.open_qm(config)
+    job = qm.execute(prog)
+
+or set HETERODYNE_FAKE_QM=1 and the scripts' `get_qm()` uses it automatically.
+`time_scale=1.0` makes results arrive at the real acquisition pace (for streaming code);
+the default makes everything available immediately.
+"""
+
+import ast
+import itertools
+import re
+import time
+import weakref
+
+import numpy as np
+
+SIM_DEFAULTS = {
+    # heterodyne beat note seen on the IQ element
+    "beat_hz": None,              # None: 2 * |IF(Aom2) - IF(Aom1)| (double-pass AOMs)
+    "beat_offset_hz": 0.0,        # extra offset on top of beat_hz (mis-tuned demod)
+    "signal_vpk": 0.2,            # beat amplitude at the ADC (V peak)
+    "phase_drift_rad_per_s": 0.01,
+    "phase_walk_rad_per_sqrt_s": 0.05,
+    "adc_noise_v": 0.002,         # white noise per ADC sample (V rms)
+    # SNSPD / dark counts
+    "click_rate_hz": 3.0,         # Poisson rate for time tagging
+    "pulse_rate_hz": 200.0,       # pulse rate in raw ADC traces
+    "pulse_amp_v": -0.2,
+    "pulse_rise_ns": 2.0,
+    "pulse_decay_ns": 50.0,
+    # timing
+    "shot_overhead_ns": 200,      # per-iteration controller overhead
+    "default_readout_ns": 1000,   # used if the measured pulse is missing from the config
+    "time_scale": None,           # None: results available at once; 1.0: real time
+}
+
+_LOOP_RE = re.compile(
+    r"with for_\((\w+),([^,]+),\((\w+)(<=|<|>=|>)([^)]+)\),\((\w+)([+-])([^)]+)\)\):")
+# for_(i, 0, (i < a) & (i < b), i + 1): the capped time-tag loop
+_CAPPED_LOOP_RE = re.compile(
+    r"with for_\((\w+),([^,]+),\(\((\w+)<([^)]+)\)&\((\w+)<([^)]+)\)\),\((\w+)\+([^)]+)\)\):")
+_FOREACH_RE = re.compile(r"with for_each_\(\((\w+)\),\((\w+)\)\):")
+_DECL_RE = re.compile(r"(\w+) = declare\((int|fixed|bool), (?:size=(\d+)|value=(\[[^\]]*\]))?")
+_MEASURE_RE = re.compile(r"measure\('(\w+)', '(\w+)'")
+_DEMOD_RE = re.compile(r"demod\.\w+\(\"(\w+)\", (\w+)")
+_TT_RE = re.compile(r"time_tagging\.\w+\((\w+), (\w+), (\w+)")
+_ADC_RE = re.compile(r"adc_stream=(\w+)")
+_SAVE_RE = re.compile(r"^save\((\w+)(?:\[\w+\])?, (\w+)\)")
+_WAIT_RE = re.compile(r"^wait\(([\w.]+)")
+_FREQ_RE = re.compile(r"^update_frequency\('(\w+)', ([\w.]+)")
+_PLAY_RE = re.compile(r"^play\('(\w+)', '(\w+)'(?:, amplitude_scale=([\w.]+))?")
+_SP_RE = re.compile(r"^(\w+)((?:\.\w+\((?:[^()]|\([^()]*\))*\))*)$")
+_OP_RE = re.compile(r"\.(\w+)\(((?:[^()]|\([^()]*\))*)\)")
+
+
+def _num(text):
+    text = text.strip()
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+# -----------------------------
+# Program parsing
+# -----------------------------
+class _Node:
+    def __init__(self, kind, **kw):
+        self.kind = kind
+        self.children = []
+        self.__dict__.update(kw)
+
+
+def _parse(script):
+    """Parse generate_qua_script output into (body tree, declarations, stream processing)."""
+    lines = script.splitlines()
+    start = next(i for i, l in enumerate(lines) if l.startswith("with program()"))
+    root = _Node("root")
+    stack = [(0, root)]
+    decls = {}
+    sp = []
+    in_sp = None
+
+    for line in lines[start + 1:]:
+        if not line.strip():
+            continue
+        indent = len(line) - len(line.lstrip())
+        if indent == 0:
+            break
+        text = line.strip()
+
+        if in_sp is not None:
+            if indent > in_sp:
+                sp.append(text)
+                continue
+            in_sp = None
+        if text.startswith("with stream_processing()"):
+            in_sp = indent
+            continue
+
+        while indent <= stack[-1][0] and len(stack) > 1:
+            stack.pop()
+        parent = stack[-1][1]
+
+        m = _DECL_RE.search(text)
+        if m:
+            name, typ, size, value = m.groups()
+            decls[name] = {"type": typ, "size": int(size) if size else None,
+                           "value": ast.literal_eval(value) if value else None}
+            continue
+
+        m = _LOOP_RE.match(text)
+        mc = _CAPPED_LOOP_RE.match(text)
+        if m:
+            var, lo, _, op, hi, _, sign, step = m.groups()
+            node = _Node("loop", var=var, start=lo, op=op, stop=hi,
+                         step=step if sign == "+" else "-" + step)
+        elif mc:
+            var, lo, _, hi, _, cap, _, step = mc.groups()
+            node = _Node("loop", var=var, start=lo, op="<", stop=hi, cap=cap, step=step)
+        elif _FOREACH_RE.match(text):
+            var, arr = _FOREACH_RE.match(text).groups()
+            node = _Node("foreach", var=var, array=arr)
+        elif text.startswith("with infinite_loop_"):
+            node = _Node("infinite")
+        elif text.startswith("with "):
+            node = _Node("block")  # if_/else_/strict_timing_...: treated as always taken
+        else:
+            _add_statement(parent, text)
+            continue
+        parent.children.append(node)
+        stack.append((indent, node))
+
+    return root, decls, sp
+
+
+def _add_statement(parent, text):
+    m = _MEASURE_RE.search(text)
+    if m and text.startswith("measure("):
+        op, element = m.groups()
+        tt = _TT_RE.search(text)
+        adc = _ADC_RE.search(text)
+        parent.children.append(_Node(
+            "measure", op=op, element=element,
+            demod=_DEMOD_RE.findall(text),
+            tt=tt.groups() if tt else None,
+            adc=adc.group(1) if adc else None,
+        ))
+        return
+    for kind, rx in (("save", _SAVE_RE), ("wait", _WAIT_RE), ("freq", _FREQ_RE), ("play", _PLAY_RE)):
+        m = rx.match(text)
+        if m:
+            parent.children.append(_Node(kind, args=m.groups()))
+            return
+
+
+# -----------------------------
+# Data synthesis
+# -----------------------------
+class _Simulation:
+    """Evaluates a parsed program against a config and produces raw stream items."""
+
+    def __init__(self, config, params, rng):
+        self.config = config
+        self.p = params
+        self.rng = rng
+        self.streams = {}       # stream name -> list of item arrays (concatenated later)
+        self.var_source = {}    # variable -> (kind, measurement record)
+        self.duration_ns = 0.0
+        self.infinite = False
+
+    # --- config helpers
+    def _pulse_len(self, element, op):
+        try:
+            pulse = self.config["elements"][element]["operations"][op]
+            return int(self.config["pulses"][pulse]["length"])
+        except (KeyError, TypeError):
+            return int(self.p["default_readout_ns"])
+
+    def _beat_hz(self):
+        if self.p["beat_hz"] is not None:
+            return self.p["beat_hz"] + self.p["beat_offset_hz"]
+        els = self.config.get("elements", {})
+        if "Aom1" in els and "Aom2" in els:
+            d = abs(els["Aom2"]["intermediate_frequency"] - els["Aom1"]["intermediate_frequency"])
+            return 2 * d + self.p["beat_offset_hz"]
+        return 10e6 + self.p["beat_offset_hz"]
+
+    # --- loop expansion
+    def _loop_values(self, node):
+        if node.kind == "foreach":
+            return np.asarray(self.decls[node.array]["value"])
+        start, stop, step = _num(node.start), _num(node.stop), _num(node.step)
+        if step == 0:
+            raise ValueError("zero loop step")
+        n = int(np.floor((stop - start) / step)) + 2
+        vals = start + step * np.arange(max(n, 0))
+        eps = 1e-9 * max(abs(step), 1)
+        ok = {"<": vals < stop - eps, "<=": vals <= stop + eps,
+              ">": vals > stop + eps, ">=": vals >= stop - eps}[node.op]
+        return vals[ok]
+
+    def run(self, root, decls):
+        self.decls = decls
+        self._walk(root.children, [], {"freq": {}, "amp": {}, "played": False})
+
+    def _walk(self, nodes, loops, state):
+        """loops: list of (var, values); state: current update_frequency / amp settings."""
+        body_wait = [n for n in nodes if n.kind == "wait"]
+        for node in nodes:
+            if node.kind in ("loop", "foreach"):
+                bound = node.stop.strip() if node.kind == "loop" else ""
+                cap = getattr(node, "cap", None)
+                if cap is not None and self.var_source.get(cap.strip(), ("",))[0] == "tt_count":
+                    bound, cap = cap.strip(), bound
+                if bound in self.var_source and self.var_source[bound][0] == "tt_count":
+                    # for_(i, 0, i < n_tags, ...): iterates over this window's tags
+                    self._walk(node.children, loops, dict(state, tag_loop=bound, tag_cap=cap))
+                else:
+                    self._walk(node.children, loops + [(node.var, self._loop_values(node))], state)
+            elif node.kind == "infinite":
+                self.infinite = True
+                self._walk(node.children, loops, state)
+            elif node.kind == "block":
+                self._walk(node.children, loops, state)
+            elif node.kind == "freq":
+                state["freq"][node.args[0]] = node.args[1]
+            elif node.kind == "play":
+                state["played"] = True
+                if node.args[2] is not None:
+                    state["amp"][node.args[1]] = node.args[2]
+            elif node.kind == "measure":
+                self._measure(node, loops, state, body_wait)
+            elif node.kind == "save":
+                self._save(node, loops, state)
+
+    def _grid(self, loops):
+        sizes = [len(v) for _, v in loops]
+        n = int(np.prod(sizes)) if sizes else 1
+        return n, sizes
+
+    def _per_shot(self, expr, loops, default=0.0):
+        """Value of a literal or loop variable for every shot of the loop grid."""
+        n, sizes = self._grid(loops)
+        if expr is None:
+            return np.full(n, default, dtype=float)
+        for i, (var, vals) in enumerate(loops):
+            if var == expr:
+                inner = int(np.prod(sizes[i + 1:])) if i + 1 < len(sizes) else 1
+                outer = int(np.prod(sizes[:i])) if i else 1
+                return np.tile(np.repeat(vals, inner), outer)
+        try:
+            return np.full(n, _num(expr), dtype=float)
+        except ValueError:
+            return np.full(n, default, dtype=float)
+
+    def _shot_times_s(self, loops, readout_ns, waits):
+        n, _ = self._grid(loops)
+        dur = np.full(n, float(readout_ns + self.p["shot_overhead_ns"]))
+        for w in waits:
+            dur += 4.0 * self._per_shot(w.args[0], loops)  # wait() is in 4 ns cycles
+        t_end = self.duration_ns + np.cumsum(dur)
+        t_start = t_end - dur
+        self.duration_ns = float(t_end[-1]) if n else self.duration_ns
+        return t_start * 1e-9
+
+    def _measure(self, node, loops, state, waits):
+        p, rng = self.p, self.rng
+        if node.tt is not None:
+            arr, win, count = node.tt
+            win_ns = int(_num(win))
+            n, _ = self._grid(loops)
+            self.duration_ns += n * (win_ns + p["shot_overhead_ns"])
+            counts = rng.poisson(p["click_rate_hz"] * win_ns * 1e-9, size=n)
+            size = self.decls.get(arr, {}).get("size") or counts.max(initial=0)
+            tags = rng.integers(0, win_ns, size=counts.sum())
+            # Sort within each window and blank the tags that did not fit in the array
+            win_id = np.repeat(np.arange(n), counts)
+            order = np.lexsort((tags, win_id))
+            tags = tags[order]
+            first = np.repeat(np.cumsum(counts) - counts, counts)
+            slot = np.arange(tags.size) - first
+            tags[slot >= size] = 0
+            self.var_source[count] = ("tt_count", counts)
+            self.var_source[arr] = ("tt_tags", tags, slot)
+            return
+
+        readout_ns = self._pulse_len(node.element, node.op)
+        t = self._shot_times_s(loops, readout_ns, waits)
+        n = t.size
+        element_if = self.config.get("elements", {}).get(node.element, {}).get("intermediate_frequency", 0)
+        f_demod = self._per_shot(state["freq"].get(node.element), loops, default=element_if)
+        amp = np.ones(n)
+        for el, expr in state["amp"].items():
+            if el != node.element:
+                amp = amp * self._per_shot(expr, loops, default=1.0)
+        df = self._beat_hz() - f_demod
+
+        if node.demod:
+            # Demod of V cos(2π f_b t + φ) against the element IF over L samples:
+            # sum ≈ V L/2 · sinc(Δf L) · e^{iφ}, in QUA fixed units (/4096)
+            L = readout_ns
+            walk = np.cumsum(rng.normal(0, 1, n) * np.sqrt(np.diff(t, prepend=0.0)))
+            phase = (2 * np.pi * df * (t + 0.5 * L * 1e-9) + p["phase_drift_rad_per_s"] * t
+                     + p["phase_walk_rad_per_sqrt_s"] * walk + rng.uniform(0, 2 * np.pi))
+            mag = p["signal_vpk"] * amp * L / 2 * np.abs(np.sinc(df * L * 1e-9)) / 4096
+            noise = p["adc_noise_v"] * np.sqrt(L / 2) / 4096
+            for weight, var in node.demod:
+                if "sin" in weight:
+                    val = mag * np.sin(phase) * (-1 if weight.startswith("minus") else 1)
+                else:
+                    val = mag * np.cos(phase)
+                self.var_source[var] = ("value", val + rng.normal(0, noise, n))
+
+        if node.adc is not None:
+            traces = np.empty((n, readout_ns), dtype=np.int16)
+            for i in range(n):
+                traces[i] = self._adc_trace(readout_ns, t[i], df[i] + f_demod[i], amp[i], state["played"])
+            self.streams.setdefault(node.adc, []).append(traces)
+
+    def _adc_trace(self, n_samples, t0, beat_hz, amp, played):
+        p, rng = self.p, self.rng
+        v = rng.normal(0, p["adc_noise_v"], n_samples)
+        if played:
+            tt = t0 + np.arange(n_samples) * 1e-9
+            v += p["signal_vpk"] * amp * np.cos(2 * np.pi * beat_hz * tt + p["phase_drift_rad_per_s"] * tt)
+        else:
+            k = rng.poisson(p["pulse_rate_hz"] * n_samples * 1e-9)
+            width = int(p["pulse_rise_ns"] * 3 + p["pulse_decay_ns"] * 8)
+            s = np.arange(width)
+            shape = (1 - np.exp(-s / p["pulse_rise_ns"])) * np.exp(-s / p["pulse_decay_ns"])
+            shape /= shape.max()
+            starts = rng.integers(0, max(n_samples - width, 1), size=k)
+            idx = (starts[:, None] + s[None, :]).ravel()
+            np.add.at(v, idx, np.tile(p["pulse_amp_v"] * shape, k))
+        return np.clip(np.round(v * 4096), -32768, 32767).astype(np.int16)
+
+    def _save(self, node, loops, state):
+        var, stream = node.args
+        n, _ = self._grid(loops)
+        src = self.var_source.get(var)
+        if src is not None and src[0] == "tt_tags":
+            values = src[1]
+            if state.get("tag_cap") is not None:
+                values = values[src[2] < int(_num(state["tag_cap"]))]
+        elif src is not None:
+            values = src[1]
+        elif any(v == var for v, _ in loops):
+            values = self._per_shot(var, loops)
+        else:
+            values = np.zeros(n)
+        self.streams.setdefault(stream, []).append(np.asarray(values))
+
+
+def _interleave(chunks):
+    """Items saved to one stream from several save() calls in the same body alternate."""
+    if len(chunks) == 1:
+        return chunks[0]
+    if len({c.shape for c in chunks}) == 1:
+        return np.stack(chunks, axis=1).reshape((-1,) + chunks[0].shape[1:])
+    return np.concatenate(chunks)
+
+
+def _apply_ops(items, ops):
+    """Apply a stream-processing chain to an (n_items, ...) array. Returns (items, mode)."""
+    mode = None
+    running = False
+    for name, arg in ops:
+        if name in ("input1", "input2"):
+            if name == "input2":
+                items = np.zeros_like(items)
+        elif name == "buffer":
+            dims = tuple(int(x) for x in arg.split(",") if x.strip())
+            size = int(np.prod(dims))
+            n = items.shape[0] // size
+            items = items[:n * size].reshape((n,) + dims + items.shape[1:])
+        elif name == "map":
+            if arg.startswith("FUNCTIONS.average"):
+                axis = arg[arg.index("(") + 1:-1].strip()
+                items = items.mean(axis=int(axis) + 1) if axis else \
+                    items.reshape(items.shape[0], -1).mean(axis=1)
+            elif arg.startswith("FUNCTIONS.dot_product"):
+                vec = np.asarray(ast.literal_eval(arg[arg.index("(") + 1:-1]), dtype=float)
+                items = items @ vec
+            else:
+                raise NotImplementedError(f"fake QM does not support map({arg})")
+        elif name == "average":
+            counts = np.arange(1, items.shape[0] + 1).reshape((-1,) + (1,) * (items.ndim - 1))
+            items = np.cumsum(items, axis=0) / counts
+            running = True
+        elif name in ("save", "save_all"):
+            mode = (name, ast.literal_eval(arg))
+        else:
+            raise NotImplementedError(f"fake QM does not support .{name}()")
+    return items, mode, running
+
+
+# -----------------------------
+# QM-like API
+# -----------------------------
+class FakeResultHandle:
+    def __init__(self, name, items, mode, job):
+        self.name = name
+        self._items = items
+        self._mode = mode
+        self._job = job
+
+    def _available(self):
+        return int(round(self._items.shape[0] * self._job._progress()))
+
+    def count_so_far(self):
+        return self._available() if self._mode == "save_all" else min(self._available(), 1)
+
+    def is_processing(self):
+        return self._job._progress() < 1.0
+
+    def wait_for_values(self, count=1, timeout=None):
+        while self.count_so_far() < count and self.is_processing():
+            time.sleep(0.01)
+
+    def wait_for_all_values(self, timeout=None):
+        self._job._wait(timeout)
+        return not self.is_processing()
+
+    def _wrap(self, items):
+        out = np.zeros(items.shape[0], dtype=[("value", items.dtype, items.shape[1:])])
+        out["value"] = items
+        return out
+
+    def fetch_all(self, **kwargs):
+        n = self._available()
+        if self._mode == "save":
+            return self._items[n - 1] if n else None
+        return self._wrap(self._items[:n])
+
+    def fetch(self, item, **kwargs):
+        n = self._available()
+        if self._mode == "save":
+            return self.fetch_all()
+        if isinstance(item, slice):
+            start, stop, _ = item.indices(n)
+            return self._wrap(self._items[start:stop])
+        return self._wrap(self._items[:n][item:item + 1])[0]
+
+
+class FakeResults:
+    def __init__(self, job, handles):
+        self._job = job
+        self._handles = handles
+
+    def get(self, name):
+        return self._handles.get(name)
+
+    def __getattr__(self, name):
+        handles = self.__dict__.get("_handles", {})
+        if name in handles:
+            return handles[name]
+        raise AttributeError(name)
+
+    def keys(self):
+        return self._handles.keys()
+
+    def is_processing(self):
+        return self._job._progress() < 1.0
+
+    def wait_for_all_values(self, timeout=None):
+        self._job._wait(timeout)
+        return not self.is_processing()
+
+
+class FakeJob:
+    _ids = itertools.count()
+
+    def __init__(self, program, config, params, rng):
+        self.id = f"fake-job-{next(self._ids)}"
+        root, decls, sp = _parse(_script(program))
+        sim = _Simulation(config, params, rng)
+        sim.run(root, decls)
+        self.infinite = sim.infinite
+        self.duration_s = sim.duration_ns * 1e-9
+        self._time_scale = params["time_scale"]
+        self._t0 = time.perf_counter()
+        self._canceled = False
+
+        handles = {}
+        for line in sp:
+            m = _SP_RE.match(line)
+            if not m:
+                raise NotImplementedError(f"fake QM cannot parse stream processing: {line}")
+            stream, chain = m.groups()
+            chunks = sim.streams.get(stream, [np.zeros(0)])
+            items, mode, _ = _apply_ops(_interleave(chunks), _OP_RE.findall(chain))
+            if mode is not None:
+                handles[mode[1]] = FakeResultHandle(mode[1], items, mode[0], self)
+        self.result_handles = FakeResults(self, handles)
+
+    def _progress(self):
+        if self._canceled:
+            return 1.0
+        if self.infinite:
+            return 0.0
+        if not self._time_scale or self.duration_s == 0:
+            return 1.0
+        elapsed = (time.perf_counter() - self._t0) / self._time_scale
+        return min(1.0, elapsed / self.duration_s)
+
+    def _wait(self, timeout=None):
+        t0 = time.perf_counter()
+        while self._progress() < 1.0:
+            if timeout is not None and time.perf_counter() - t0 > timeout:
+                return
+            time.sleep(0.01)
+
+    def wait_until(self, state, timeout=None):
+        pass
+
+    def get_status(self):
+        return "Running" if self._progress() < 1.0 else "Done"
+
+    def is_running(self):
+        return self._progress() < 1.0
+
+    def cancel(self):
+        self._canceled = True
+
+    halt = cancel
+
+
+# Generated script per program; entries go away with their program
+_script_cache = weakref.WeakKeyDictionary()
+
+
+def _script(program):
+    from qm import generate_qua_script
+    script = _script_cache.get(program)
+    if script is None:
+        script = _script_cache[program] = generate_qua_script(program)
+    return script
+
+
+class FakeQM:
+    def __init__(self, qm_id, config, params, rng):
+        self.id = qm_id
+        self.config = config
+        self._params = params
+        self._rng = rng
+        self._compiled = {}
+
+    def get_config(self):
+        return self.config
+
+    def execute(self, program, **kwargs):
+        return FakeJob(program, self.config, self._params, self._rng)
+
+    def compile(self, program, **kwargs):
+        program_id = f"fake-program-{len(self._compiled)}"
+        self._compiled[program_id] = program
+        return program_id
+
+    def add_to_queue(self, program, **kwargs):
+        if isinstance(program, str):
+            program = self._compiled[program]
+        return self.execute(program)
+
+    def close(self):
+        pass
+
+
+class FakeQuantumMachinesManager:
+    """Drop-in for QuantumMachinesManager(host=..., cluster_name=...) with synthetic data."""
+
+    def __init__(self, host=None, cluster_name=None, seed=None, **params):
+        unknown = set(params) - set(SIM_DEFAULTS)
+        if unknown:
+            raise TypeError(f"unknown simulation parameters: {sorted(unknown)}")
+        self.params = dict(SIM_DEFAULTS, **params)
+        self.rng = np.random.default_rng(seed)
+        self._qms = {}
+        self._next = 0
+
+    def open_qm(self, config, close_other_machines=True, **kwargs):
+        if close_other_machines:
+            self._qms.clear()
+        qm_id = f"fake-qm-{self._next}"
+        self._next += 1
+        self._qms[qm_id] = FakeQM(qm_id, config, self.params, self.rng)
+        return self._qms[qm_id]
+
+    def list_open_qms(self):
+        return list(self._qms)
+
+    def get_qm(self, machine_id):
+        return self._qms[machine_id]
+
+    def close_all_qms(self):
+        self._qms.clear()
+
+    def close(self):
+        self._qms.clear()
@@ -0,0 +1,80 @@
+"""
+if_calibration.py
+
+Measure the Aom1/Aom2 beat frequency on the ADC and use it as the demodulation IF.
+
+`calibrate_beat` runs a short program that plays the references and records
+`n_traces` raw ADC traces of the readout pulse on the IQ element. It then estimates
+the beat frequency on the host (Analysis/beat.py) and returns it with its uncertainty
+and the time each step took. The measurement scripts call it before building their
+main program, and `update_frequency("lf_in1_iq", ...)` then uses the measured value:
+
+    qm = get_qm(config, qop_ip, cluster_name)
+    if CALIBRATE_IF:
+        DEMOD_FREQ_HZ = calibrate_beat(qm, config, f_expected=DEMOD_FREQ_HZ)["if_hz"]
+    with program() as main: ...
+        update_frequency("lf_in1_iq", DEMOD_FREQ_HZ)
+
+For a trace of L ns the FFT bin is 1/L (20 kHz for the 50 us readout). Interpolation
+and the phase-slope fit bring the estimate down to about a Hz at the usual SNR, and
+averaging n_traces traces improves it by sqrt(n_traces).
+"""
+
+import time
+
+from qm.qua import align, declare, declare_stream, for_, measure, play, program, stream_processing, wait
+
+from Phase_Measure.Analysis.allan import readout_length_ns
+from Phase_Measure.Analysis.beat import estimate_beat
+from Phase_Measure.Drivers.stream_fetch import fetch_values
+
+SAMPLE_RATE_HZ = 1e9  # ADC samples per second (one per ns)
+
+
+def beat_trace_program(element="lf_in1_iq", references=("Aom1", "Aom2"), n_traces=10,
+                       wait_cycles=250, operation="readout", stream="beat_trace"):
+    """Play the references and save n_traces raw ADC traces of `operation` on `element`."""
+    with program() as prog:
+        n = declare(int)
+        adc_st = declare_stream(adc_trace=True)
+        with for_(n, 0, n < n_traces, n + 1):
+            align(*references, element)
+            for ref in references:
+                play("cw", ref)
+            measure(operation, element, adc_stream=adc_st)
+            wait(wait_cycles)
+
+        with stream_processing():
+            adc_st.input1().save_all(stream)
+    return prog
+
+
+def calibrate_beat(qm, config, element="lf_in1_iq", references=("Aom1", "Aom2"), f_expected=None,
+                   search_hz=1e6, n_traces=10, operation="readout", verbose=True):
+    """
+    Measure the beat frequency seen by `element`.
+
+    Returns the estimate dict of `estimate_beat` plus if_hz (freq_hz rounded to the
+    integer Hz that update_frequency takes), acquire_s and estimate_s.
+    """
+    length = readout_length_ns(config, element, operation)
+    prog = beat_trace_program(element, references, n_traces, operation=operation)
+
+    t0 = time.perf_counter()
+    res = qm.execute(prog).result_handles
+    res.wait_for_all_values()
+    traces = fetch_values(res, "beat_trace", scale="raw2volts").reshape(-1, length)
+    t1 = time.perf_counter()
+    est = estimate_beat(traces, SAMPLE_RATE_HZ, f_expected, search_hz)
+    t2 = time.perf_counter()
+
+    est["if_hz"] = int(round(est["freq_hz"]))
+    est["acquire_s"] = t1 - t0
+    est["estimate_s"] = t2 - t1
+    if verbose:
+        shift = "" if f_expected is None else f" ({est['freq_hz'] - f_expected:+,.1f} Hz vs expected)"
+        print(f"Beat on {element}: {est['freq_hz']:,.1f} +- {est['sigma_hz']:.2f} Hz{shift}, "
+              f"{est['n_traces']} traces x {length} samples (FFT bin {est['bin_hz'] / 1e3:.0f} kHz), "
+              f"amplitude {est['amp_v'] * 1e3:.1f} mV; "
+              f"acquire {est['acquire_s']:.2f} s, estimate {est['estimate_s'] * 1e3:.0f} ms")
+    return est
@@ -1,12 +1,16 @@
 
 from qm.qua import *
-from qm import QuantumMachinesManager
-from phase_config import qop_ip, cluster_name, config
+from Phase_Measure.Drivers.phase_config import qop_ip, cluster_name, config
+from Phase_Measure.Drivers.qm_session import get_qm
+from Phase_Measure.Drivers.stream_fetch import fetch_values
+from Phase_Measure.Drivers.stream_reduce import save_reduced
 # -------------------------
 # User knobs
 # -------------------------
 DEMOD_FREQ_HZ = 5_000_000   # <---- change this later as needed
 N_SHOTS = 10_000            # fixed acquisition count (no infinite loop)
+REDUCTION = "raw"           # "raw", "block_average", "decimate", "running_average" (see stream_reduce.py)
+BLOCK = 100                 # shots per block for block_average / decimate
 
 with program() as iq_acquire_in1:
     n = declare(int)
@@ -33,20 +37,20 @@ with program() as iq_acquire_in1:
         save(Q, Q_st)
 
     with stream_processing():
-        I_st.save_all("I")
-        Q_st.save_all("Q")
+        save_reduced(I_st, "I", REDUCTION, BLOCK)
+        save_reduced(Q_st, "Q", REDUCTION, BLOCK)
 
 
-qmm = QuantumMachinesManager(host=qop_ip, cluster_name=cluster_name)
-qm = qmm.open_qm(config)
+# Reuses the QM session daemon (qm_session.py) if it is running
+qm = get_qm(config, qop_ip, cluster_name)
 
 job = qm.execute(iq_acquire_in1)
 res = job.result_handles
 res.wait_for_all_values()
 
-I_data = res.get("I").fetch_all()
-Q_data = res.get("Q").fetch_all()
+I_data = fetch_values(res, "I")
+Q_data = fetch_values(res, "Q")
 
-print(f"Fetched {len(I_data)} shots.")
+print(f"Fetched {len(I_data)} values ({REDUCTION}).")
 print("First 10 I:", I_data[:10])
 print("First 10 Q:", Q_data[:10])
@@ -0,0 +1,135 @@
+"""
+pipeline.py
+
+Double-buffered acquisition/analysis loop for repeated captures.
+
+In the serial loop the OPX sits idle while the host converts, analyses and saves the
+previous trace. Here the main thread only runs the capture and fetches the raw result,
+then hands it to a background worker thread through a bounded queue and immediately
+starts the next capture. The worker does the conversion/detection/persistence.
+
+- Back-pressure: if the worker falls `maxsize` traces behind, `submit` blocks, so host
+  memory stays bounded and the slowdown shows up in the duty cycle.
+- Duty cycle: fraction of wall time the ADC was actually acquiring,
+  (captures * acquisition length) / elapsed wall time.
+
+NumPy releases the GIL in the heavy array work, so a thread is enough here.
+"""
+
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class AnalysisWorker:
+    """Runs `process(item)` on a background thread for every submitted item."""
+
+    def __init__(self, process, maxsize=2):
+        self.process = process
+        self.n_processed = 0
+        self.busy_s = 0.0
+        self.error = None
+        self._q = queue.Queue(maxsize=maxsize)
+        self._thread = threading.Thread(target=self._run, name="analysis-worker", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._q.get()
+            if item is _STOP:
+                return
+            if self.error is not None:
+                continue  # keep draining so submit() never deadlocks after a failure
+            t0 = time.perf_counter()
+            try:
+                self.process(item)
+            except Exception as e:  # re-raised in the main thread on next submit/close
+                self.error = e
+            self.busy_s += time.perf_counter() - t0
+            self.n_processed += 1
+
+    @property
+    def backlog(self):
+        return self._q.qsize()
+
+    def submit(self, item):
+        """Queue an item for processing; blocks while the queue is full."""
+        if self.error is not None:
+            raise RuntimeError("analysis worker failed") from self.error
+        self._q.put(item)
+
+    def close(self):
+        """Wait for all queued items to be processed and stop the thread."""
+        self._q.put(_STOP)
+        self._thread.join()
+        if self.error is not None:
+            raise RuntimeError("analysis worker failed") from self.error
+
+
+def run_captures(acquire, process, acquire_s, n_captures=None, pipelined=True,
+                 maxsize=2, report_every=1):
+    """
+    Repeatedly call `acquire()` (run one capture and return its raw result) and
+    `process(raw)` on each result.
+
+    acquire_s:    ADC acquisition time of one capture in seconds (e.g. readout length),
+                  used for the duty cycle.
+    n_captures:   stop after this many captures (None = run until Ctrl+C).
+    pipelined:    True = process on a background worker while the next capture runs;
+                  False = the old serial loop (useful for before/after comparison).
+    report_every: print a status line every N captures (0 = never).
+
+    Returns a dict with captures, wall_s, duty_cycle and the time the main thread
+    spent blocked on back-pressure.
+    """
+    worker = AnalysisWorker(process, maxsize=maxsize) if pipelined else None
+    n = 0
+    blocked_s = 0.0
+    t_start = time.perf_counter()
+    try:
+        while n_captures is None or n < n_captures:
+            raw = acquire()
+            n += 1
+            if worker is not None:
+                t0 = time.perf_counter()
+                worker.submit(raw)
+                blocked_s += time.perf_counter() - t0
+            else:
+                process(raw)
+
+            if report_every and n % report_every == 0:
+                wall = time.perf_counter() - t_start
+                backlog = f", backlog {worker.backlog}" if worker is not None else ""
+                print(f"capture {n}: duty cycle {n * acquire_s / wall:.1%}{backlog}")
+    except KeyboardInterrupt:
+        print("Stopping, waiting for queued analysis to finish...")
+    finally:
+        if worker is not None:
+            worker.close()
+
+    wall = time.perf_counter() - t_start
+    stats = {
+        "captures": n,
+        "wall_s": wall,
+        "duty_cycle": n * acquire_s / wall if wall > 0 else float("nan"),
+        "blocked_s": blocked_s,
+    }
+    print(f"{n} captures in {wall:.2f} s, duty cycle {stats['duty_cycle']:.1%}")
+    return stats
+
+
+if __name__ == "__main__":
+    # Toy demo: 50 ms "captures" and 40 ms analysis, serial vs pipelined
+    def fake_acquire():
+        time.sleep(0.05)
+        return None
+
+    def fake_process(raw):
+        time.sleep(0.04)
+
+    serial = run_captures(fake_acquire, fake_process, 0.05, n_captures=20,
+                          pipelined=False, report_every=0)
+    piped = run_captures(fake_acquire, fake_process, 0.05, n_captures=20, report_every=0)
+    assert piped["duty_cycle"] > serial["duty_cycle"]
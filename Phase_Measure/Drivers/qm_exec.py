@@ -0,0 +1,119 @@
+"""
+qm_exec.py
+
+Compile-once, run-many execution of QUA programs.
+
+`qm.execute(prog)` recompiles and re-uploads the program every time it is called. For
+loops that run the same capture over and over (continuous_capture.py), `ProgramRunner`
+compiles each program once with `qm.compile()` -- cached on (program content, config
+fingerprint), so a rebuilt identical program hits the cache too -- and then only
+re-queues the precompiled program id. It also records per-run latency so the dead time
+between captures can be compared with and without precompilation:
+
+    runner = ProgramRunner(qm, config)
+    while True:
+        job = runner.run(prog)           # compile on first call, re-queue afterwards
+        data = job.result_handles.get("adc1_single_run").fetch_all()
+    runner.print_summary()
+
+Works with both the QOP 2.x (`qm.queue.add_compiled`) and the QOP 3.x
+(`qm.add_to_queue`) job APIs.
+"""
+
+import hashlib
+import time
+
+import numpy as np
+
+from Phase_Measure.Drivers.config_cache import config_fingerprint
+
+
+def program_fingerprint(program):
+    """SHA-256 hex digest of a QUA program's serialized protobuf (equal programs match)."""
+    data = program.qua_program.SerializeToString(deterministic=True)
+    return hashlib.sha256(data).hexdigest()
+
+
+class ProgramRunner:
+    """
+    Run QUA programs on an open QM, compiling each (program, config) pair only once.
+
+    compile_once=False falls back to `qm.execute` every run (the old behaviour) while
+    keeping the same latency bookkeeping, for before/after comparisons.
+    """
+
+    def __init__(self, qm, config=None, compile_once=True):
+        self.qm = qm
+        self.config_key = config_fingerprint(config) if config is not None else None
+        self.compile_once = compile_once
+        self._program_ids = {}
+        self.compile_s = {}
+        # One entry per run: (start_latency_s, run_s, gap_s)
+        self.timings = []
+        self._last_done = None
+
+    def compile(self, program):
+        """Return the compiled program id, compiling on first use."""
+        key = (program_fingerprint(program), self.config_key)
+        if key not in self._program_ids:
+            t0 = time.perf_counter()
+            self._program_ids[key] = self.qm.compile(program)
+            self.compile_s[key] = time.perf_counter() - t0
+        return self._program_ids[key]
+
+    def submit(self, program):
+        """Queue a program and wait until it is running. Returns the job."""
+        if not self.compile_once:
+            return self.qm.execute(program)
+
+        program_id = self.compile(program)
+        if hasattr(self.qm, "add_to_queue"):  # QOP 3.x API
+            job = self.qm.add_to_queue(program_id)
+            job.wait_until("Running")
+            return job
+        return self.qm.queue.add_compiled(program_id).wait_for_execution()
+
+    def run(self, program, wait=True):
+        """
+        Submit a program, optionally wait for all its results, and record timing.
+
+        start latency: call -> job running (compile/upload/queue cost)
+        run:           job running -> all values available
+        gap:           previous run's results available -> this job running
+                       (i.e. host time + start latency, the dead time between captures)
+        """
+        t_call = time.perf_counter()
+        job = self.submit(program)
+        t_running = time.perf_counter()
+        if wait:
+            job.result_handles.wait_for_all_values()
+        t_done = time.perf_counter()
+
+        gap = t_running - self._last_done if self._last_done is not None else float("nan")
+        self.timings.append((t_running - t_call, t_done - t_running, gap))
+        self._last_done = t_done
+        return job
+
+    def summary(self):
+        """Median/mean of each timing column, in seconds."""
+        if not self.timings:
+            return {}
+        t = np.asarray(self.timings)
+        out = {"runs": len(t), "compile_s": sum(self.compile_s.values())}
+        for col, name in enumerate(("start_latency_s", "run_s", "gap_s")):
+            vals = t[:, col][np.isfinite(t[:, col])]
+            out[name + "_median"] = float(np.median(vals)) if vals.size else float("nan")
+            out[name + "_mean"] = float(np.mean(vals)) if vals.size else float("nan")
+        return out
+
+    def print_summary(self):
+        s = self.summary()
+        if not s:
+            print("No runs recorded.")
+            return
+        mode = "compile-once" if self.compile_once else "execute every run"
+        print(f"{s['runs']} runs ({mode}), compile {s['compile_s'] * 1e3:.1f} ms")
+        print(f"  start latency: median {s['start_latency_s_median'] * 1e3:.1f} ms, "
+              f"mean {s['start_latency_s_mean'] * 1e3:.1f} ms")
+        print(f"  gap between captures: median {s['gap_s_median'] * 1e3:.1f} ms, "
+              f"mean {s['gap_s_mean'] * 1e3:.1f} ms")
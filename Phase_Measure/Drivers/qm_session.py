@@ -0,0 +1,331 @@
+"""
+qm_session.py
+
+Persistent local session daemon that keeps the QuantumMachinesManager connection and
+the open QM alive between script invocations, plus a thin client with the same shape
+as the parts of the QM API the scripts use (execute / compile / add_to_queue, job
+result handles with get / fetch / fetch_all / count_so_far / wait_for_all_values).
+
+Start the daemon once (it stays in the foreground, Ctrl+C to stop):
+
+    python -m Phase_Measure.Drivers.qm_session --host 192.168.88.249 --cluster Cluster
+
+Then in the scripts:
+
+    qm = get_qm(config, qop_ip, cluster_name)   # daemon if running, else a direct QMM
+    job = qm.execute(prog)
+    res = job.result_handles
+    res.wait_for_all_values()
+    I = res.get("I").fetch_all()
+
+Back-to-back runs skip the manager connection and `open_qm` (the daemon only reopens
+when the config changes) and programs are compiled once per (program, config).
+
+Programs travel as serialized QUA protobuf and results come back as NumPy arrays over
+a `multiprocessing.managers` socket on localhost. `serve(qmm)` accepts any object with
+an `open_qm(config)` method, so the daemon can be run against a local stand-in manager.
+
+Clients must present the session key: $HETERODYNE_QM_SESSION_KEY if set, otherwise the
+key in ~/.cache/heterodyne_qm_session.key, which the daemon creates on first start
+(random, readable by its owner only). Other local users cannot drive the QM.
+"""
+
+import argparse
+import hashlib
+import os
+import secrets
+import stat
+import threading
+from collections import OrderedDict
+from multiprocessing.managers import BaseManager
+
+from Phase_Measure.Drivers.config_cache import QMCache, config_fingerprint
+from Phase_Measure.Drivers.qm_exec import ProgramRunner
+
+DEFAULT_ADDRESS = ("127.0.0.1", 50777)
+AUTHKEY_ENV = "HETERODYNE_QM_SESSION_KEY"
+DEFAULT_AUTHKEY_PATH = os.path.join(os.path.expanduser("~"), ".cache", "heterodyne_qm_session.key")
+MAX_JOBS = 32  # jobs kept for fetching; least recently used finished ones are dropped beyond this
+
+
+def load_authkey(path=DEFAULT_AUTHKEY_PATH, create=False):
+    """
+    Session key: $HETERODYNE_QM_SESSION_KEY, else the owner-only key file at `path`
+    (created with a random key if `create`). Raises FileNotFoundError if there is none.
+    """
+    env = os.environ.get(AUTHKEY_ENV)
+    if env:
+        return env.encode()
+    if create and not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+    if os.name == "posix" and os.stat(path).st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+        raise PermissionError(f"{path} is accessible by other users; chmod 600 it")
+    with open(path) as f:
+        return f.read().strip().encode()
+
+
+def _program_bytes(program):
+    return program.qua_program.SerializeToString()
+
+
+def _program_from_bytes(data):
+    from qm.program.program import Program
+    return Program.from_protobuf(data)
+
+
+class _Session:
+    """Server-side state: one manager, the currently open QM and recent jobs."""
+
+    def __init__(self, qmm):
+        self.qmm = qmm
+        self._lock = threading.RLock()
+        self._qm_cache = QMCache(qmm)
+        self._configs = {}  # fingerprint -> config, so clients only send the fingerprint
+        self._config_key = None
+        self._qm = None
+        self._runner = None
+        self._programs = {}
+        self._jobs = OrderedDict()
+        self._next_job = 0
+        self.stats = {"open_qm": 0, "reused_qm": 0, "jobs": 0}
+
+    def _open(self, key):
+        if key != self._config_key:
+            try:
+                config = self._configs[key]
+            except KeyError:
+                raise KeyError("unknown config fingerprint, call open_qm(config) first") from None
+            # open_qm closes other machines by default, so only one QM is kept
+            self._qm = self._qm_cache.open_qm(config)
+            self._runner = ProgramRunner(self._qm, config)
+            self._programs = {}
+            self._config_key = key
+            self.stats["open_qm"] += 1
+        else:
+            self.stats["reused_qm"] += 1
+        return key
+
+    def _program(self, data):
+        h = hashlib.sha1(data).hexdigest()
+        if h not in self._programs:
+            self._programs[h] = _program_from_bytes(data)
+        return h
+
+    def open_qm(self, config):
+        """Open (or reuse) a QM for `config` and return its fingerprint."""
+        with self._lock:
+            key = config_fingerprint(config)
+            self._configs[key] = config
+            return self._open(key)
+
+    def compile(self, config_key, program_data):
+        with self._lock:
+            self._open(config_key)
+            h = self._program(program_data)
+            self._runner.compile(self._programs[h])
+            return h
+
+    def submit(self, config_key, program_data):
+        """Queue a program (compiled once per config) and return a job id."""
+        with self._lock:
+            self._open(config_key)
+            h = self._program(program_data)
+            job = self._runner.submit(self._programs[h])
+            job_id = self._next_job
+            self._next_job += 1
+            self._jobs[job_id] = job
+            self._evict()
+            self.stats["jobs"] += 1
+            return job_id
+
+    def _evict(self):
+        """Drop the least recently used jobs beyond MAX_JOBS, never one still running."""
+        excess = len(self._jobs) - MAX_JOBS
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if not self._jobs[job_id].result_handles.is_processing():
+                del self._jobs[job_id]
+                excess -= 1
+
+    def _job(self, job_id):
+        with self._lock:
+            try:
+                self._jobs.move_to_end(job_id)  # most recently used
+                return self._jobs[job_id]
+            except KeyError:
+                raise KeyError(f"job {job_id} is not held by the session (expired?)") from None
+
+    def _res(self, job_id):
+        return self._job(job_id).result_handles
+
+    def is_processing(self, job_id):
+        return self._res(job_id).is_processing()
+
+    def wait_for_all_values(self, job_id, timeout=None):
+        return self._res(job_id).wait_for_all_values(timeout)
+
+    def names(self, job_id):
+        return list(self._res(job_id).keys())
+
+    def count_so_far(self, job_id, name):
+        return self._res(job_id).get(name).count_so_far()
+
+    def fetch(self, job_id, name, start=None, stop=None):
+        handle = self._res(job_id).get(name)
+        if start is None and stop is None:
+            return handle.fetch_all()
+        return handle.fetch(slice(start or 0, stop))
+
+    def cancel(self, job_id):
+        self._job(job_id).cancel()
+
+    def get_stats(self):
+        return dict(self.stats)
+
+
+class SessionManager(BaseManager):
+    pass
+
+
+class _ClientManager(BaseManager):
+    pass
+
+
+_ClientManager.register("session")
+
+
+def serve(qmm, address=DEFAULT_ADDRESS, authkey=None):
+    """
+    Serve a session around `qmm` (real or stand-in manager) until interrupted.
+    authkey=None: load_authkey(), creating the key file on first start.
+    """
+    if authkey is None:
+        authkey = load_authkey(create=True)
+    session = _Session(qmm)
+    SessionManager.register("session", callable=lambda: session)
+    manager = SessionManager(address=address, authkey=authkey)
+    server = manager.get_server()
+    print(f"QM session listening on {address[0]}:{address[1]}")
+    server.serve_forever()
+
+
+# -----------------------------
+# Client side
+# -----------------------------
+class RemoteHandle:
+    def __init__(self, session, job_id, name):
+        self._s, self._job_id, self.name = session, job_id, name
+
+    def count_so_far(self):
+        return self._s.count_so_far(self._job_id, self.name)
+
+    def fetch_all(self):
+        return self._s.fetch(self._job_id, self.name)
+
+    def fetch(self, item):
+        if isinstance(item, slice):
+            return self._s.fetch(self._job_id, self.name, item.start, item.stop)
+        return self._s.fetch(self._job_id, self.name, item, item + 1)[0]
+
+
+class RemoteResults:
+    def __init__(self, session, job_id):
+        self._s, self._job_id = session, job_id
+
+    def get(self, name):
+        return RemoteHandle(self._s, self._job_id, name)
+
+    def keys(self):
+        return self._s.names(self._job_id)
+
+    def is_processing(self):
+        return self._s.is_processing(self._job_id)
+
+    def wait_for_all_values(self, timeout=None):
+        return self._s.wait_for_all_values(self._job_id, timeout)
+
+
+class RemoteJob:
+    def __init__(self, session, job_id):
+        self._s, self.id = session, job_id
+        self.result_handles = RemoteResults(session, job_id)
+
+    def wait_until(self, state, timeout=None):
+        pass  # the daemon returns only once the job is running
+
+    def cancel(self):
+        self._s.cancel(self.id)
+
+
+class RemoteQM:
+    """QM-like handle whose programs run in the session daemon."""
+
+    def __init__(self, session, config):
+        self._s = session
+        self.config = config
+        self.config_key = self._s.open_qm(config)
+
+    def execute(self, program):
+        return RemoteJob(self._s, self._s.submit(self.config_key, _program_bytes(program)))
+
+    # compile / add_to_queue let ProgramRunner drive a RemoteQM unchanged
+    def compile(self, program):
+        self._s.compile(self.config_key, _program_bytes(program))
+        return program
+
+    def add_to_queue(self, program):
+        return self.execute(program)
+
+
+def connect(address=DEFAULT_ADDRESS, authkey=None):
+    """Connect to a running daemon and return its session proxy (authkey=None: load_authkey())."""
+    if authkey is None:
+        authkey = load_authkey()
+    manager = _ClientManager(address=address, authkey=authkey)
+    manager.connect()
+    return manager.session()
+
+
+def get_qm(config, host, cluster_name, use_session=True, address=DEFAULT_ADDRESS):
+    """
+    Return an open QM for `config`: through the session daemon when it is running,
+    otherwise (or with use_session=False) from a fresh QuantumMachinesManager.
+
+    With the environment variable HETERODYNE_FAKE_QM=1 the offline simulator
+    (fake_qm.py) is used instead and no hardware is contacted.
+    """
+    if os.environ.get("HETERODYNE_FAKE_QM", "") not in ("", "0"):
+        from Phase_Measure.Drivers.fake_qm import FakeQuantumMachinesManager
+        print("HETERODYNE_FAKE_QM set: using the simulated QM backend.")
+        return FakeQuantumMachinesManager(host=host, cluster_name=cluster_name).open_qm(config)
+    if use_session:
+        try:
+            return RemoteQM(connect(address), config)
+        except (ConnectionRefusedError, FileNotFoundError):
+            print("No QM session daemon running, connecting directly.")
+    from qm import QuantumMachinesManager
+    qmm = QuantumMachinesManager(host=host, cluster_name=cluster_name)
+    # Re-attaches to the QM left open by a previous run if the config is unchanged
+    return QMCache(qmm).open_qm(config)
+
+
+if __name__ == "__main__":
+    from Phase_Measure.Drivers.phase_config import qop_ip, cluster_name
+
+    parser = argparse.ArgumentParser(description="Keep a QuantumMachinesManager session open.")
+    parser.add_argument("--host", default=qop_ip)
+    parser.add_argument("--cluster", default=cluster_name)
+    parser.add_argument("--port", type=int, default=DEFAULT_ADDRESS[1])
+    parser.add_argument("--fake", action="store_true", help="serve the offline simulator (fake_qm.py)")
+    args = parser.parse_args()
+
+    if args.fake:
+        from Phase_Measure.Drivers.fake_qm import FakeQuantumMachinesManager as QuantumMachinesManager
+    else:
+        from qm import QuantumMachinesManager
+    serve(QuantumMachinesManager(host=args.host, cluster_name=args.cluster),
+          address=(DEFAULT_ADDRESS[0], args.port))
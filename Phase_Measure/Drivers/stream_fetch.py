@@ -0,0 +1,148 @@
+"""
+stream_fetch.py
+
+Incremental fetch of `save_all` streams while a job is still running.
+
+Instead of `res.wait_for_all_values()` followed by one big `fetch_all()`, poll the
+handles' `count_so_far()` and fetch only the newly arrived slice, in chunks of at most
+`chunk_size` shots. Every chunk is yielded as contiguous 1-D NumPy arrays (one per
+stream, all the same length), so analysis/plotting/saving overlaps the acquisition and
+peak memory is bounded by the chunk size:
+
+    for I, Q in iter_chunks(job.result_handles, ("I", "Q"), chunk_size=10_000):
+        phase = np.arctan2(Q, I)
+        ...
+
+`iter_ragged` does the same for a count stream plus a variable number of items per
+count (time tags per window, rate_count.py).
+
+All fetch helpers return the structured `save_all` output as a plain 1-D view of its
+'value' field, so there is no per-shot Python unpacking (`[x[0] for x in raw]`) and no
+copy unless the record has other fields. Unit conversions are applied vectorized with
+`scale=`, using the factors of qualang_tools' `unit` (the same object the configs build),
+in place when the fetched array is float:
+
+    trace_v = fetch_values(res, "adc1_single_run", scale="raw2volts")  # ADC units -> V
+    I_v = fetch_values(res, "I", scale=("demod2volts", READOUT_LEN))    # demod.full -> V
+"""
+
+import time
+
+import numpy as np
+from qualang_tools.units import unit
+
+_UNIT = unit(coerce_to_integer=True)
+
+
+def _values(data):
+    """Plain 1-D array from a fetched slice (`save_all` gives a structured 'value' field)."""
+    data = np.asarray(data)
+    if data.dtype.names and "value" in data.dtype.names:
+        data = data["value"]
+    return np.ascontiguousarray(data).reshape(-1)
+
+
+def raw2volts(x, out=None, u=_UNIT):
+    """Raw ADC samples -> volts with `u.raw2volts` (pass out=x to convert in place)."""
+    return np.multiply(x, u.raw2volts(1.0), out=out)
+
+
+def demod2volts(x, duration_ns, single_demod=False, out=None, u=_UNIT):
+    """Demodulated fixed-point values -> volts with `u.demod2volts` (out=x: in place)."""
+    return np.multiply(x, u.demod2volts(1.0, duration_ns, single_demod), out=out)
+
+
+def scale_values(x, scale=None):
+    """
+    Apply a unit conversion to a fetched 1-D array.
+
+    scale: None (unchanged), a number (multiplied), "raw2volts", or
+           ("demod2volts", duration_ns[, single_demod]).
+    Float arrays are converted in place; integer ADC data gets one float64 array.
+    """
+    if scale is None:
+        return x
+    out = x if x.dtype.kind == "f" and x.flags.writeable else None
+    if isinstance(scale, str):
+        scale = (scale,)
+    if isinstance(scale, tuple):
+        kind, *args = scale
+        if kind == "raw2volts":
+            return raw2volts(x, out=out)
+        if kind == "demod2volts":
+            return demod2volts(x, *args, out=out)
+        raise ValueError(f"unknown scale {kind!r}")
+    return np.multiply(x, scale, out=out)
+
+
+def fetch_values(res, name, scale=None):
+    """Fetch everything saved under `name` as a 1-D array (a single `save` gives length 1)."""
+    return scale_values(_values(res.get(name).fetch_all()), scale)
+
+
+def iter_chunks(res, names=("I", "Q"), chunk_size=10_000, poll_s=0.1, expected=None, scale=None):
+    """
+    Yield tuples of equally long chunks for the streams `names` as they arrive.
+
+    res:        job.result_handles
+    chunk_size: number of shots per yielded chunk (the last one may be shorter)
+    poll_s:     sleep between polls when less than one chunk is available
+    expected:   total number of shots, if known; fetching stops there
+    scale:      unit conversion applied to every chunk (see scale_values)
+
+    Streams are kept aligned: a chunk is only fetched once every stream has it.
+    """
+    handles = [res.get(name) for name in names]
+    pos = 0
+    while True:
+        # Check for completion *before* counting so no late values are missed
+        done = not res.is_processing()
+        avail = min(h.count_so_far() for h in handles)
+        if expected is not None:
+            avail = min(avail, expected)
+
+        while avail - pos >= chunk_size or (done and avail > pos):
+            stop = min(pos + chunk_size, avail)
+            yield tuple(scale_values(_values(h.fetch(slice(pos, stop))), scale) for h in handles)
+            pos = stop
+
+        if done or (expected is not None and pos >= expected):
+            return
+        time.sleep(poll_s)
+
+
+def iter_ragged(res, count_name, item_name, chunk_size=100, poll_s=0.1, expected=None, cap=None):
+    """
+    Yield (counts, items) chunks of a ragged pair of streams as they arrive.
+
+    `count_name` gets one value per iteration (e.g. tags per window) and `item_name`
+    that many values (capped at `cap`) saved after it -- the n_per_win / t_in_win pair of
+    rate_count.py. chunk_size and expected count iterations of the count stream; each
+    chunk carries exactly the items of its iterations.
+    """
+    h_count, h_items = res.get(count_name), res.get(item_name)
+    pos = item_pos = 0
+    while True:
+        done = not res.is_processing()
+        avail = h_count.count_so_far()
+        if expected is not None:
+            avail = min(avail, expected)
+
+        while avail - pos >= chunk_size or (done and avail > pos):
+            stop = min(pos + chunk_size, avail)
+            counts = _values(h_count.fetch(slice(pos, stop)))
+            n_items = int((np.minimum(counts, cap) if cap is not None else counts).clip(0).sum())
+            # Items of the last iteration may still be in flight
+            while h_items.count_so_far() < item_pos + n_items:
+                if not res.is_processing() and h_items.count_so_far() < item_pos + n_items:
+                    raise RuntimeError(f"'{item_name}' ended before the {n_items} items "
+                                       f"announced by '{count_name}'")
+                time.sleep(poll_s)
+            items = (_values(h_items.fetch(slice(item_pos, item_pos + n_items))) if n_items
+                     else np.array([], dtype=np.int64))
+            yield counts, items
+            pos, item_pos = stop, item_pos + n_items
+
+        if done or (expected is not None and pos >= expected):
+            return
+        time.sleep(poll_s)
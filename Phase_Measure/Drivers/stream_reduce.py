@@ -0,0 +1,61 @@
+"""
+stream_reduce.py
+
+Optional on-controller reduction of per-shot streams (I, Q, ...) in stream_processing,
+so only the statistics that are needed are sent to the host.
+
+Use inside a program's stream_processing block, in place of `st.save_all(name)`:
+
+    with stream_processing():
+        save_reduced(I_st, "I", REDUCTION, BLOCK)
+        save_reduced(Q_st, "Q", REDUCTION, BLOCK)
+
+Modes:
+- "raw":             every shot (`save_all`), same as before
+- "block_average":   mean of each block of BLOCK consecutive shots -> N_SHOTS // BLOCK values
+- "decimate":        first shot of each block of BLOCK shots      -> N_SHOTS // BLOCK values
+- "running_average": running mean over all shots so far, saved as a single value
+                     (fetch it any time during the run for a live estimate)
+
+Incomplete trailing blocks are dropped by the controller, so choose BLOCK to divide
+N_SHOTS. Transfer volume drops by the block factor (or to one value).
+"""
+
+from qm.qua import FUNCTIONS
+
+REDUCTIONS = ("raw", "block_average", "decimate", "running_average")
+
+
+def save_reduced(stream, name, mode="raw", block=1):
+    """Attach the reduction `mode` to `stream` and save it under `name`."""
+    if mode not in REDUCTIONS:
+        raise ValueError(f"unknown reduction {mode!r}, expected one of {REDUCTIONS}")
+    if block < 1:
+        raise ValueError("block must be >= 1")
+
+    if mode == "raw":
+        stream.save_all(name)
+    elif mode == "block_average":
+        stream.buffer(block).map(FUNCTIONS.average()).save_all(name)
+    elif mode == "decimate":
+        # Dot product with a one-hot vector picks the first shot of each block
+        one_hot = [1.0] + [0.0] * (block - 1)
+        stream.buffer(block).map(FUNCTIONS.dot_product(one_hot)).save_all(name)
+    else:
+        stream.average().save(name)
+
+
+def reduced_length(n_shots, mode="raw", block=1):
+    """Number of values the host will receive for `n_shots` shots."""
+    if mode == "raw":
+        return n_shots
+    if mode == "running_average":
+        return 1
+    return n_shots // block
+
+
+def shots_per_value(mode="raw", block=1):
+    """Shots behind each received value (sets the sample spacing of reduced data)."""
+    if mode in ("block_average", "decimate"):
+        return block
+    return 1
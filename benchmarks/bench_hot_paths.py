@@ -0,0 +1,204 @@
+"""
+bench_hot_paths.py
+
+Benchmarks for the host-side analysis hot paths, on synthetic data (no OPX needed):
+
+- timestamps:    absolute time-tag reconstruction (rate_count.py)
+- timestamps_loop: the original per-window Python loop, for reference
+- pulses:        pulse/event detection on a raw ADC trace (continuous_capture.py)
+- pulses_loop:   the original per-sample Python loop, for reference
+- iq_listcomp:   fetch_all() output -> [x[0] for x in raw] -> arctan2 -> unwrap
+                 (the original multishot_measure.py / PhaseMeasurement.py path)
+- iq_phase:      the same through fetch_values-style array views
+
+Each case is run for every size (number of samples / shots / tags), reporting the best
+wall time over --repeat runs and the peak traced memory (tracemalloc, separate run).
+
+Run from the repo root:
+
+    python -m benchmarks.bench_hot_paths                        # 1e3 .. 1e6
+    python -m benchmarks.bench_hot_paths --range 1e3 1e8 --cases pulses timestamps
+    python -m benchmarks.bench_hot_paths --sizes 5e5 2e6        # just these sizes
+    python -m benchmarks.bench_hot_paths --save baseline.json   # store a baseline
+    python -m benchmarks.bench_hot_paths --compare baseline.json
+
+With --compare the exit code is 1 if any case got slower than --tolerance x baseline
+(timings below --min-ms are too noisy to flag and are only reported).
+"""
+
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from Phase_Measure.Analysis.pulse_detect import detect_pulses, _detect_pulses_loop
+from Phase_Measure.Analysis.timetags import reconstruct_timestamps, _reconstruct_timestamps_loop
+from Phase_Measure.Drivers.stream_fetch import _values
+
+DEFAULT_SIZES = [10**3, 10**4, 10**5, 10**6]
+LOOP_MAX_SIZE = 10**7  # pure-Python reference cases are skipped above this size
+
+
+# -----------------------------
+# Synthetic data
+# -----------------------------
+def _structured(values):
+    """Mimic `fetch_all()` of a save_all stream: structured array with a 'value' field."""
+    out = np.zeros(values.size, dtype=[("value", values.dtype)])
+    out["value"] = values
+    return out
+
+
+def make_timetags(n, rng):
+    """~n tags spread over windows of 1 s at ~4 clicks per window."""
+    n_win = max(n // 4, 1)
+    n_per_win = rng.poisson(4.0, n_win)
+    t_in_win = np.sort(rng.integers(0, 10**9, n_per_win.sum()))
+    return n_per_win, t_in_win.astype(np.int64), 10**9
+
+
+def make_trace(n, rng):
+    """Raw ADC trace (V) with noise and a negative pulse every ~5000 samples."""
+    trace = rng.normal(0.0, 0.01, n)
+    starts = rng.integers(0, max(n - 200, 1), max(n // 5000, 1))
+    for s in np.sort(starts):
+        trace[s:s + 50] -= 0.2
+    return (trace,)
+
+
+def make_iq(n, rng):
+    t = np.arange(n)
+    phase = 1e-4 * t + np.cumsum(rng.normal(0, 1e-3, n))
+    return _structured(np.cos(phase)), _structured(np.sin(phase))
+
+
+# -----------------------------
+# Cases
+# -----------------------------
+def case_timestamps(n_per_win, t_in_win, win_len):
+    return reconstruct_timestamps(n_per_win, t_in_win, win_len)
+
+
+def case_timestamps_loop(n_per_win, t_in_win, win_len):
+    return _reconstruct_timestamps_loop(n_per_win, t_in_win, win_len)
+
+
+def case_pulses(trace):
+    return detect_pulses(trace)
+
+
+def case_pulses_loop(trace):
+    return _detect_pulses_loop(trace)
+
+
+def case_iq_listcomp(I_raw, Q_raw):
+    I = [x[0] for x in I_raw]
+    Q = [x[0] for x in Q_raw]
+    return np.unwrap(np.arctan2(Q, I))
+
+
+def case_iq_phase(I_raw, Q_raw):
+    return np.unwrap(np.arctan2(_values(Q_raw), _values(I_raw)))
+
+
+CASES = {
+    "timestamps": (make_timetags, case_timestamps, None),
+    "timestamps_loop": (make_timetags, case_timestamps_loop, LOOP_MAX_SIZE),
+    "pulses": (make_trace, case_pulses, None),
+    "pulses_loop": (make_trace, case_pulses_loop, LOOP_MAX_SIZE),
+    "iq_listcomp": (make_iq, case_iq_listcomp, LOOP_MAX_SIZE),
+    "iq_phase": (make_iq, case_iq_phase, None),
+}
+
+
+def run_case(fn, args, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+
+    gc.collect()
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"wall_s": best, "peak_mb": peak / 2**20}
+
+
+def run(cases, sizes, repeat, seed=0):
+    results = {}
+    for name in cases:
+        make, fn, max_size = CASES[name]
+        results[name] = {}
+        for n in sizes:
+            if max_size is not None and n > max_size:
+                continue
+            args = make(n, np.random.default_rng(seed))
+            r = run_case(fn, args, repeat)
+            results[name][str(n)] = r
+            print(f"{name:<15} n={n:>11,d}  {r['wall_s'] * 1e3:10.3f} ms  {r['peak_mb']:9.2f} MB peak")
+            del args
+    return results
+
+
+def compare(results, baseline, tolerance, min_s=1e-3):
+    """Print ratios vs. a stored baseline; return True if anything regressed."""
+    regressed = False
+    print(f"\nComparison with baseline (tolerance {tolerance:.2f}x):")
+    for name, by_size in results.items():
+        for n, r in by_size.items():
+            b = baseline.get(name, {}).get(n)
+            if b is None:
+                continue
+            ratio = r["wall_s"] / b["wall_s"] if b["wall_s"] > 0 else float("inf")
+            mem_ratio = r["peak_mb"] / b["peak_mb"] if b["peak_mb"] > 0 else float("nan")
+            slower = ratio > tolerance and r["wall_s"] > min_s
+            flag = "REGRESSION" if slower else ""
+            regressed |= slower
+            print(f"{name:<15} n={int(n):>11,d}  time x{ratio:6.2f}  memory x{mem_ratio:6.2f}  {flag}")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark host-side analysis hot paths.")
+    parser.add_argument("--cases", nargs="+", default=list(CASES), choices=list(CASES))
+    sizes = parser.add_mutually_exclusive_group()
+    sizes.add_argument("--sizes", nargs="+", type=float, help="explicit list of sizes")
+    sizes.add_argument("--range", nargs=2, type=float, metavar=("LO", "HI"),
+                       help="every decade from LO to HI (e.g. 1e3 1e8)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", help="write results as a JSON baseline")
+    parser.add_argument("--compare", help="JSON baseline to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.2)
+    parser.add_argument("--min-ms", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    if args.range is not None:
+        lo, hi = (int(round(np.log10(s))) for s in args.range)
+        sizes = [10**e for e in range(lo, hi + 1)]
+    elif args.sizes is None:
+        sizes = DEFAULT_SIZES
+    else:
+        sizes = [int(s) for s in args.sizes]
+
+    results = run(args.cases, sizes, args.repeat)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        return 1 if compare(results, baseline, args.tolerance, args.min_ms * 1e-3) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
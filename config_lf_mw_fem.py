@@ -22,6 +22,44 @@ mw_delay = 0 * u.ns
 
 wait_between_runs = 100
 
+# Time-tagging channels: element name -> LF-FEM analog input. rate_count.py tags all of
+# them in parallel; e.g. {"snspd": 1, "snspd2": 2} for a second detector on input 2.
+snspd_inputs = {"snspd": 1}
+snspd_threshold = -0.10      # Volts; set to your SNSPD pulse level (negative or positive)
+snspd_polarity = "Below"     # "Below" for negative pulses, "Above" for positive
+
+
+def snspd_element(port, threshold=snspd_threshold, polarity=snspd_polarity):
+    """Time-tagging element reading SNSPD pulses on LF-FEM analog input `port`."""
+    return {
+        "outputs": {"out1": (con, lf_fem, port)},  # ADC input sees SNSPD pulses (via your room-temp chain)
+        "digitalInputs": {
+            "marker": {
+                "port": (con, lf_fem, 1),
+                "delay": 0,
+                "buffer": 0,
+            }
+        },
+        "operations": {"readout": "snspd_readout"},
+        "time_of_flight": 28 * u.ns,
+        "smearing": 0,
+        "outputPulseParameters": {
+            "signalThreshold": threshold,
+            "signalPolarity": polarity,
+            'derivativeThreshold': -10000,  # in ADC units / ns (OPX+)
+            'derivativePolarity': 'Above'
+        },
+    }
+
+
+def analog_input():
+    return {
+        "offset": 0,
+        "gain_db": 3,
+        "sampling_rate": sampling_rate,
+    }
+
+
 config = {
     "version": 1,
     "controllers": {
@@ -50,11 +88,7 @@ config = {
                     },
                     "digital_outputs": {1: {}},
                     "analog_inputs": {
-                        1: {
-                            "offset": 0,
-                            "gain_db": 3,
-                            "sampling_rate": sampling_rate,
-                        },
+                        port: analog_input() for port in sorted({1, *snspd_inputs.values()})
                     },
                 },
                 mw_fem: {
@@ -94,25 +128,7 @@ config = {
         }
     },
     "elements": {
-        "snspd": {
-            "outputs": {"out1": (con, lf_fem, 1)},  # ADC In1 sees SNSPD pulses (via your room-temp chain)
-            "digitalInputs": {
-                "marker": {
-                    "port": (con, lf_fem, 1),
-                    "delay": 0,
-                    "buffer": 0,
-                }
-            },
-            "operations": {"readout": "snspd_readout"},
-            "time_of_flight": 28 * u.ns,
-            "smearing": 0,
-            "outputPulseParameters": {
-                "signalThreshold": -0.10,  # Volts; set to your SNSPD pulse level (negative or positive)
-                "signalPolarity": "Below",  # "Below" for negative pulses, "Above" for positive
-                'derivativeThreshold': -10000,  # in ADC units / ns (OPX+)
-                'derivativePolarity': 'Above'
-            },
-        },
+        **{name: snspd_element(port) for name, port in snspd_inputs.items()},
         "lf_out1": {
             "singleInput": {"port": (con, lf_fem, 1)},  # controller, FEM index, port number
             "intermediate_frequency": 1000 * u.kHz,  # the tone’s digital IF
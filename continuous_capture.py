@@ -1,10 +1,35 @@
+import time
+
 import qm.qua as qua
-from qm import QuantumMachinesManager
-from Phase_Measure.Drivers.phase_config import config, qop_ip, cluster_name
+from config_lf_mw_fem import config, qop_ip, cluster_name, snspd_inputs
+from Phase_Measure.Drivers.qm_session import get_qm
 import numpy as np
-from qualang_tools.units import unit
+from Phase_Measure.Analysis.pulse_detect import detect_pulses
+from Phase_Measure.Analysis.snippet_store import SnippetStore
+from Phase_Measure.Drivers.pipeline import run_captures
+from Phase_Measure.Drivers.qm_exec import ProgramRunner
+from Phase_Measure.Drivers.stream_fetch import fetch_values, raw2volts
+from Phase_Measure.Analysis.tagfile import TagFileWriter
+from Phase_Measure.Analysis.timetags import reconstruct_timestamps
+from Phase_Measure.Drivers.event_capture import (
+    TransferCounter, event_capture_program, event_window_ns, fetch_events,
+)
+
 
-u = unit(coerce_to_integer=True)
+READOUT_LEN_NS = 10_000_000  # length of "readout_pulse" (ADC acquisition time per trace capture)
+PIPELINED = True             # analyse the previous trace while the next capture runs
+COMPILE_ONCE = True          # compile dual_tone_loopback once, then only re-queue it
+# "trace":  stream the full raw ADC trace and cut pulse snippets on the host
+# "events": find the pulses on the controller (time tagging with the snspd element's
+#           outputPulseParameters threshold) and only stream their times
+CAPTURE_MODE = "trace"
+TRACE_THRESHOLD_V = -0.05  # trace mode: host cut, pulses go below this level (V)
+EVENT_ELEMENT = next(iter(snspd_inputs))  # time-tagging element on the same ADC input
+# Event mode: one tagging window per capture, as long as the element's "readout" pulse
+EVENT_WINDOW_NS = event_window_ns(config, EVENT_ELEMENT)
+MAX_EVENTS = 256                          # tag array size per capture (extra events are counted, not timed)
+# Event times (ns): host time since the first capture started + time within the capture
+EVENTS_PATH = time.strftime("events_%Y%m%d_%H%M%S.tags")
 
 ###################
 # The QUA program #
@@ -30,29 +55,82 @@ with qua.program() as dual_tone_loopback:
         adc_st.input1().save("adc1_single_run")
         #adc_st.input1().buffer(2).save_all("adc1_single_run")
 
+# Event mode: the controller thresholds the input and returns only the count and the
+# in-capture times (ns) of the pulses
+event_capture = event_capture_program(EVENT_ELEMENT, EVENT_WINDOW_NS, MAX_EVENTS)
+
 #####################################
 #  Open Communication with the QOP  #
 #####################################
-qmm = QuantumMachinesManager(host=qop_ip, cluster_name=cluster_name)
+# Reuses the QM session daemon (qm_session.py) if it is running
+qm = get_qm(config, qop_ip, cluster_name)
 ###########################
 # Run and Fetch Results   #
 ###########################
-qm = qmm.open_qm(config)
-dark_counts = []
-N = 1
-while True:
-    job = qm.execute(dual_tone_loopback)
-    res = job.result_handles
-    res.wait_for_all_values()
-    adc1_single_run = u.raw2volts(res.get("adc1_single_run").fetch_all())
-    i = 150
-    while i < len(adc1_single_run):
-        if adc1_single_run[i] < -0.05:
-            dark_counts.append(adc1_single_run[i-100:i+1000])
-            i += 1000
-        else:
-            i += 1
-    print(len(dark_counts))
-
-    dark_counts_copy = np.array(dark_counts)
-    np.savez("counts_no_signal_2", dark_counts_copy)
\ No newline at end of file
+runner = ProgramRunner(qm, config, compile_once=COMPILE_ONCE)
+# Bytes fetched from the controller and pulses found, to compare the two modes
+transfer = TransferCounter(CAPTURE_MODE)
+
+if CAPTURE_MODE == "trace":
+    # Append-only; reopen later with np.load("counts_no_signal_2.npy", mmap_mode="r")
+    dark_counts = SnippetStore("counts_no_signal_2.npy", width=100 + 1000)
+
+    def acquire():
+        job = runner.run(dual_tone_loopback)
+        res = job.result_handles
+        return fetch_values(res, "adc1_single_run")
+
+    def process(raw):
+        adc1_single_run = raw2volts(raw)
+        # Keep 100 samples before / 1000 after each hit, skip 1000 after each hit
+        _, snippets = detect_pulses(adc1_single_run, threshold=TRACE_THRESHOLD_V, pre=100,
+                                    post=1000, holdoff=1000, start=150)
+        dark_counts.append(snippets)
+        transfer.add([raw], len(snippets))
+        print(len(dark_counts))
+
+    capture_s = READOUT_LEN_NS * 1e-9
+
+elif CAPTURE_MODE == "events":
+    # Captures are separate jobs with dead time in between, so each window is placed at
+    # the host time its job started running (monotonic clock, ~ms accurate)
+    dark_counts = TagFileWriter(EVENTS_PATH)
+    capture_clock = {"t0_ns": None, "start_ns": None}  # first job start, latest window start
+
+    def acquire():
+        t_queued = time.monotonic_ns()
+        job = runner.run(event_capture)
+        started_ns = t_queued + int(runner.timings[-1][0] * 1e9)  # + start latency
+        n, t = fetch_events(job.result_handles)
+        return started_ns, n, t
+
+    def process(raw):
+        started_ns, n, t = raw
+        if capture_clock["t0_ns"] is None:
+            capture_clock["t0_ns"] = started_ns
+        start_ns = started_ns - capture_clock["t0_ns"]
+        if capture_clock["start_ns"] is not None:
+            # A window cannot open before the previous one closed; keeps the file ordered
+            start_ns = max(start_ns, capture_clock["start_ns"] + EVENT_WINDOW_NS)
+        capture_clock["start_ns"] = start_ns
+        # Beyond MAX_EVENTS only the first MAX_EVENTS times are on the controller: keep those
+        in_window_ns = reconstruct_timestamps(n, t, EVENT_WINDOW_NS, max_tags=MAX_EVENTS,
+                                              drop_truncated=False)
+        if n[0] > MAX_EVENTS:
+            print(f"capture {transfer.captures}: {int(n[0])} events, only the first {MAX_EVENTS} timed")
+        dark_counts.append(in_window_ns + start_ns)
+        transfer.add([n, t], min(int(n[0]), MAX_EVENTS))
+        print(transfer.events)
+
+    capture_s = EVENT_WINDOW_NS * 1e-9
+
+else:
+    raise ValueError(f"unknown CAPTURE_MODE {CAPTURE_MODE!r}, expected 'trace' or 'events'")
+
+
+run_captures(acquire, process, acquire_s=capture_s, pipelined=PIPELINED,
+             report_every=10)
+dark_counts.close()
+runner.print_summary()
+
+print(transfer.summary_line())
@@ -4,6 +4,10 @@ rate_count.py
 Measures click/event rate from an SNSPD (or similar) by repeating time-tagging over
 multiple windows, streaming counts per window and raw (in-window) timestamps.
 
+All detectors in TAGGING_ELEMENTS (by default every SNSPD element built by
+config_lf_mw_fem.py, see `snspd_inputs` there) are tagged in parallel in the same
+windows, each with its own `n_per_win_<element>` / `t_in_win_<element>` streams.
+
 This version avoids two common QUA pitfalls:
 1) `qua.save()` may not accept arithmetic expressions like (times[i] + k*WIN_LEN_NS).
 2) QUA `int` is typically 32-bit, so "absolute timestamps in ns" can overflow quickly.
@@ -12,12 +16,28 @@ Instead, we:
 - stream `n_per_win` (counts per window)
 - stream `t_in_win` (timestamps within each window, as returned by your API)
 - reconstruct absolute timestamps on the host with int64
+
+With STREAMING = True (for long runs, e.g. hours of dark counts) the windows are
+consumed as they arrive: running / rolling rate and inter-click interval statistics are
+kept in constant memory (rate_stats.py), timestamps are appended to TIMESTAMPS_PATH
+and a summary line is printed every SUMMARY_EVERY_S instead of the full timestamp list.
+
+Timestamps are saved in the delta-encoded tag format of tagfile.py, one file per
+channel; read them back with `TagFile(path).read(t_start_ns, t_stop_ns)`.
 """
 
+import time
+
 import numpy as np
 import qm.qua as qua
-from qm import QuantumMachinesManager
-from Phase_Measure.Drivers.phase_config import config, qop_ip, cluster_name
+from config_lf_mw_fem import config, qop_ip, cluster_name, snspd_inputs
+from Phase_Measure.Drivers.qm_session import get_qm
+from Phase_Measure.Drivers.stream_fetch import iter_ragged, fetch_values
+from Phase_Measure.Analysis.rate_stats import RateCounter
+from Phase_Measure.Analysis.tagfile import TagFileWriter
+from Phase_Measure.Analysis.timetags import (
+    reconstruct_channels, truncated_windows, inter_click_intervals,
+)
 
 # -----------------------------
 # User parameters
@@ -25,6 +45,16 @@ from Phase_Measure.Drivers.phase_config import config, qop_ip, cluster_name
 WIN_LEN_NS = 1_000_000_000   # 1 s tagging window (good for 1–5 Hz)
 MEAS_DURATION_S = 8          # total measurement time in seconds
 MAX_TAGS = 64                # max timestamps per window to keep
+TAGGING_ELEMENTS = list(snspd_inputs)  # elements tagged in parallel, e.g. ["snspd", "snspd2"]
+
+# Streaming mode (constant memory, for multi-hour runs)
+STREAMING = False
+CHUNK_WINDOWS = 10           # windows per fetched chunk
+ROLLING_WINDOWS = 60         # windows in the rolling rate
+SUMMARY_EVERY_S = 10.0       # wall-clock seconds between summary lines
+
+SAVE_TIMESTAMPS = True       # also write them to disk in batch mode (streaming always does)
+TIMESTAMPS_PATH = time.strftime("timetags_%Y%m%d_%H%M%S_{element}.tags")
 
 # If your QUA time tags are in clock cycles (CC) rather than ns, set these:
 TAGS_ARE_CLOCK_CYCLES = False
@@ -38,117 +68,157 @@ N_WINDOWS = int(np.ceil(MEAS_DURATION_S * 1e9 / WIN_LEN_NS))
 # -----------------------------
 # QUA program
 # -----------------------------
-with qua.program() as click_rate_prog:
-    times = qua.declare(int, size=MAX_TAGS)  # in-window timestamps
-    n_tags = qua.declare(int)                # count in this window
-    i = qua.declare(int)                     # tag index
-    k = qua.declare(int)                     # window index
-
-    n_st = qua.declare_stream()              # counts per window
-    t_st = qua.declare_stream()              # flattened in-window timestamps
-
-    qua.align("snspd")
-
-    with qua.for_(k, 0, k < N_WINDOWS, k + 1):
-        # Tag events over the window
-        qua.measure(
-            "readout",
-            "snspd",
-            qua.time_tagging.analog(times, WIN_LEN_NS, n_tags),
-        )
-
-        # Stream the count for this window
-        qua.save(n_tags, n_st)
-
-        # Stream exactly n_tags timestamps from this window (raw, in-window)
-        with qua.for_(i, 0, i < n_tags, i + 1):
-            qua.save(times[i], t_st)
-
-        # NOTE:
-        # Usually, the time_tagging.measure occupies the full WIN_LEN_NS window.
-        # If you find the loop runs "too fast" (i.e., not actually integrating over WIN_LEN_NS),
-        # you may need an explicit wait here depending on your setup/element timing model.
-        # Do NOT add it blindly without verifying your element clock unit:
-        #
-        # qua.wait(int(WIN_LEN_NS / 4), "snspd")  # example if 4 ns ticks
-
-    with qua.stream_processing():
-        n_st.save_all("n_per_win")
-        t_st.save_all("t_in_win")
+def make_click_rate_prog(elements, n_windows=N_WINDOWS, win_len_ns=WIN_LEN_NS, max_tags=MAX_TAGS):
+    """Time-tag all `elements` in parallel over n_windows windows of win_len_ns."""
+    with qua.program() as prog:
+        times = [qua.declare(int, size=max_tags) for _ in elements]  # in-window timestamps
+        n_tags = [qua.declare(int) for _ in elements]                 # count in this window
+        i = qua.declare(int)                                          # tag index
+        k = qua.declare(int)                                          # window index
+
+        n_st = [qua.declare_stream() for _ in elements]              # counts per window
+        t_st = [qua.declare_stream() for _ in elements]              # flattened in-window timestamps
+
+        with qua.for_(k, 0, k < n_windows, k + 1):
+            # Start every channel's window together; the measurements on different
+            # elements then run in parallel on the controller
+            qua.align(*elements)
+            for el, t, n in zip(elements, times, n_tags):
+                qua.measure("readout", el, qua.time_tagging.analog(t, win_len_ns, n))
+
+            for t, n, ns, ts in zip(times, n_tags, n_st, t_st):
+                # Stream the count for this window
+                qua.save(n, ns)
+
+                # Stream the timestamps from this window (raw, in-window). n can exceed
+                # max_tags; only the first max_tags entries of `t` are valid, so the loop
+                # is capped and the host flags those windows as truncated.
+                with qua.for_(i, 0, (i < n) & (i < max_tags), i + 1):
+                    qua.save(t[i], ts)
+
+            # NOTE:
+            # Usually, the time_tagging.measure occupies the full WIN_LEN_NS window.
+            # If you find the loop runs "too fast" (i.e., not actually integrating over WIN_LEN_NS),
+            # you may need an explicit wait here depending on your setup/element timing model.
+            # Do NOT add it blindly without verifying your element clock unit:
+            #
+            # qua.wait(int(WIN_LEN_NS / 4), *elements)  # example if 4 ns ticks
+
+        with qua.stream_processing():
+            for el, ns, ts in zip(elements, n_st, t_st):
+                ns.save_all(f"n_per_win_{el}")
+                ts.save_all(f"t_in_win_{el}")
+    return prog
+
+
+click_rate_prog = make_click_rate_prog(TAGGING_ELEMENTS)
 
 
 # -----------------------------
 # Run & fetch
 # -----------------------------
-qmm = QuantumMachinesManager(host=qop_ip, cluster_name=cluster_name)
-qm = qmm.open_qm(config)
+# Reuses the QM session daemon (qm_session.py) if it is running
+qm = get_qm(config, qop_ip, cluster_name)
 job = qm.execute(click_rate_prog)
 
 res = job.result_handles
-res.wait_for_all_values()
-
-n_per_win = np.array(res.get("n_per_win").fetch_all(), dtype=int)
-t_in_win = np.array(res.get("t_in_win").fetch_all(), dtype=np.int64)
 
-# -----------------------------
-# Unit handling
-# -----------------------------
-# We reconstruct absolute timestamps on the host:
-# abs_t = t_in_win + window_index * WIN_LEN
-#
-# But we need per-window grouping. `t_in_win` is a flat stream containing all timestamps
-# from window 0, then all from window 1, etc. We use n_per_win to slice it.
-
-if TAGS_ARE_CLOCK_CYCLES:
-    # Convert everything to ns for reporting on host
-    t_in_win_ns = t_in_win * CLOCK_PERIOD_NS
-    win_len_ns_for_abs = WIN_LEN_NS
+# If your tags are in clock cycles, convert everything to ns on the host
+tag_scale = CLOCK_PERIOD_NS if TAGS_ARE_CLOCK_CYCLES else 1
+paths = {el: TIMESTAMPS_PATH.format(element=el) for el in TAGGING_ELEMENTS}
+
+if STREAMING:
+    # Windows are processed as they arrive: constant memory, timestamps go to disk
+    counters = {el: RateCounter(WIN_LEN_NS, MAX_TAGS, rolling_windows=ROLLING_WINDOWS)
+                for el in TAGGING_ELEMENTS}
+    stores = {el: TagFileWriter(paths[el]) for el in TAGGING_ELEMENTS}
+    # Every channel yields the same window chunks, so the iterators advance together
+    chunks = zip(*(iter_ragged(res, f"n_per_win_{el}", f"t_in_win_{el}", chunk_size=CHUNK_WINDOWS,
+                               expected=N_WINDOWS, cap=MAX_TAGS) for el in TAGGING_ELEMENTS))
+    last_print = time.monotonic()
+    try:
+        for per_channel in chunks:
+            for el, (n_chunk, t_chunk) in zip(TAGGING_ELEMENTS, per_channel):
+                stores[el].append(counters[el].update(n_chunk, t_chunk.astype(np.int64) * tag_scale))
+            if time.monotonic() - last_print >= SUMMARY_EVERY_S:
+                for el in TAGGING_ELEMENTS:
+                    stores[el].flush()
+                    print(f"{el}: {counters[el].summary_line()}")
+                last_print = time.monotonic()
+    finally:
+        for store in stores.values():
+            store.close()
+
+    for el in TAGGING_ELEMENTS:
+        counter = counters[el]
+        print(f"{el}: {counter.summary_line()}")
+        if counter.n_truncated:
+            print(f"WARNING: {el}: {counter.n_truncated} window(s) had more than MAX_TAGS={MAX_TAGS} "
+                  f"events; their timestamps are truncated and excluded from the interval statistics.")
+        print(f"{el}: {len(stores[el])} absolute timestamps (ns) written to {paths[el]}")
 else:
-    t_in_win_ns = t_in_win
-    win_len_ns_for_abs = WIN_LEN_NS
-
-# Rebuild absolute timestamps as int64 (safe for long durations)
-abs_ts_ns_chunks = []
-idx = 0
-for k, n in enumerate(n_per_win):
-    if n <= 0:
-        continue
-    ts_chunk = t_in_win_ns[idx: idx + n]
-    abs_ts_ns_chunks.append(ts_chunk + np.int64(k) * np.int64(win_len_ns_for_abs))
-    idx += n
-
-abs_ts_ns = np.concatenate(abs_ts_ns_chunks) if abs_ts_ns_chunks else np.array([], dtype=np.int64)
-
-# -----------------------------
-# Rate calculations
-# -----------------------------
-win_s = WIN_LEN_NS * 1e-9
-rates_hz = n_per_win / win_s
-
-total_time_s = len(n_per_win) * win_s
-total_events = int(n_per_win.sum())
-overall_rate_hz = total_events / total_time_s if total_time_s > 0 else float("nan")
-
-print(f"Window length: {win_s:.3f} s")
-print(f"Windows: {len(n_per_win)}")
-print(f"Total time: {total_time_s:.3f} s")
-print("Counts per window:", n_per_win.tolist())
-print("Rates per window (Hz):", rates_hz.tolist())
-print(f"Total events: {total_events}")
-print(f"Overall rate: {overall_rate_hz:.6f} Hz")
-
-# Inter-click interval stats (often more meaningful at low Hz)
-if abs_ts_ns.size >= 2:
-    abs_ts_ns_sorted = np.sort(abs_ts_ns)
-    dt_s = np.diff(abs_ts_ns_sorted) * 1e-9
-
-    print(f"Median inter-click interval: {np.median(dt_s):.6f} s")
-    print(f"Mean inter-click interval:   {np.mean(dt_s):.6f} s")
-
-    inst_rate_hz = 1.0 / dt_s
-    print(f"Median instantaneous rate:   {np.median(inst_rate_hz):.6f} Hz")
-else:
-    print("Not enough timestamps to compute inter-click intervals.")
-
-# Optional: print timestamps (can be large)
-print("All absolute timestamps (ns):", abs_ts_ns.tolist())
+    res.wait_for_all_values()
+
+    n_per_win = np.stack([fetch_values(res, f"n_per_win_{el}").astype(np.int64, copy=False)
+                          for el in TAGGING_ELEMENTS])
+    t_in_win_ns = [fetch_values(res, f"t_in_win_{el}").astype(np.int64, copy=False) * tag_scale
+                   for el in TAGGING_ELEMENTS]
+
+    # -----------------------------
+    # Absolute timestamps
+    # -----------------------------
+    # We reconstruct absolute timestamps on the host:
+    # abs_t = t_in_win + window_index * WIN_LEN
+    #
+    # Each `t_in_win_<element>` is a flat stream containing the timestamps from window 0,
+    # then window 1, etc. (min(n, MAX_TAGS) per window); the window index of each tag is
+    # n_per_win expanded (timetags.py), for all channels in one pass. Windows with
+    # n > MAX_TAGS lost tags and are left out. Results are int64 (safe for long
+    # durations) and already in time order.
+    channels = reconstruct_channels(n_per_win, t_in_win_ns, WIN_LEN_NS, max_tags=MAX_TAGS)
+
+    # -----------------------------
+    # Rate calculations
+    # -----------------------------
+    win_s = WIN_LEN_NS * 1e-9
+    total_time_s = n_per_win.shape[1] * win_s
+
+    print(f"Window length: {win_s:.3f} s")
+    print(f"Windows: {n_per_win.shape[1]}")
+    print(f"Total time: {total_time_s:.3f} s")
+
+    for el, counts, (abs_ts_ns, tag_windows) in zip(TAGGING_ELEMENTS, n_per_win, channels):
+        rates_hz = counts / win_s
+        total_events = int(counts.sum())
+        overall_rate_hz = total_events / total_time_s if total_time_s > 0 else float("nan")
+
+        print(f"\n--- {el} ---")
+        print("Counts per window:", counts.tolist())
+        print("Rates per window (Hz):", rates_hz.tolist())
+        print(f"Total events: {total_events}")
+        print(f"Overall rate: {overall_rate_hz:.6f} Hz")
+
+        bad_windows = truncated_windows(counts, MAX_TAGS)
+        if bad_windows.size:
+            print(f"WARNING: {bad_windows.size} window(s) had more than MAX_TAGS={MAX_TAGS} events; "
+                  f"their timestamps are truncated and excluded from the interval statistics "
+                  f"(counts/rates above are unaffected). Windows: {bad_windows.tolist()}")
+
+        # Inter-click interval stats (often more meaningful at low Hz)
+        dt_s = inter_click_intervals(abs_ts_ns, tag_windows, len(counts), bad_windows) * 1e-9
+        if dt_s.size >= 1:
+            print(f"Median inter-click interval: {np.median(dt_s):.6f} s")
+            print(f"Mean inter-click interval:   {np.mean(dt_s):.6f} s")
+
+            inst_rate_hz = 1.0 / dt_s
+            print(f"Median instantaneous rate:   {np.median(inst_rate_hz):.6f} Hz")
+        else:
+            print("Not enough timestamps to compute inter-click intervals.")
+
+        if SAVE_TIMESTAMPS:
+            with TagFileWriter(paths[el]) as w:
+                w.append(abs_ts_ns)
+            print(f"{abs_ts_ns.size} absolute timestamps (ns) written to {paths[el]}")
+
+        # Optional: print timestamps (can be large)
+        print("All absolute timestamps (ns):", abs_ts_ns.tolist())